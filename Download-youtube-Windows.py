@@ -1,13 +1,35 @@
 import os
+import time
+import queue
 import shutil
+import threading
 import yt_dlp
+from yt_dlp.utils import DownloadCancelled
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext
+from tkinter import ttk, messagebox, scrolledtext, simpledialog
+from yt_info_cache import InfoCache, INFO_CACHE_FILE, extract_info, download_info, entry_key, cache_key
+from yt_archive import DownloadArchive
+from yt_transfer import BandwidthLimiter, transfer_options, adopt_partials
+
+# Videos downloaded on an earlier day are skipped; set this to hard-link them into today's folder instead
+LINK_ARCHIVED = False
+
+# Background engine settings: downloads run at once, how often the GUI drains their events, and how often
+# each download reports progress
+DOWNLOAD_WORKERS = 3
+PUMP_INTERVAL_MS = 100
+PROGRESS_INTERVAL = 0.5
+
+# Transfer settings: fragments fetched at once per video, and a cap in bytes/sec shared by every download
+# in the queue, e.g. 5 * 1024 * 1024 (None for no cap)
+FRAGMENT_WORKERS = 8
+BANDWIDTH_LIMIT = None
 
 
 # Function to download YouTube video or audio using yt-dlp
-def download_best_format(url, base_path, file_type, output_box):
+def download_best_format(url, base_path, file_type, job):
     # Create base directory if it doesn't exist
     if not os.path.exists(base_path):
         os.makedirs(base_path)
@@ -17,40 +39,87 @@ def download_best_format(url, base_path, file_type, output_box):
     save_path = os.path.join(base_path, today)
     os.makedirs(save_path, exist_ok=True)
 
+    # Resolved info dicts are reused across runs, so a repeat lookup or format listing needs no extraction
+    cache = InfoCache(os.path.join(base_path, INFO_CACHE_FILE))
+    # Videos finished on any earlier day, checked before anything is extracted or downloaded
+    archive = DownloadArchive(base_path)
+    link_folder = save_path if LINK_ARCHIVED else None
+    # Archive kinds are lower case, as in the command-line downloaders; playlist entries are always videos
+    kind = file_type.lower()
+    # Downloads interrupted on an earlier day are continued in today's folder
+    adopt_partials(base_path, save_path)
+    job.engine.limiter.watch(save_path)
+
     # yt-dlp options
     ydl_opts = {
         'outtmpl': f'{save_path}/%(title)s.%(ext)s',  # Save with video title as file name
         'format': 'best',  # Default to the best format
         'noplaylist': False,  # Allow playlist download
+        # Progress and cancellation for the job's row in the queue, then the bandwidth cap shared by all jobs
+        'progress_hooks': [job.progress_hook, job.engine.limiter.hook],
+        'quiet': True,
+        'noprogress': True,
+        **transfer_options(FRAGMENT_WORKERS),  # Parallel fragments, resumable partial files
     }
 
     try:
-        # Get available formats and check if it's a playlist
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
+        archived = archive.find(cache_key(url), kind, link_folder)
+        if archived is not None:
+            job.log(f"Already downloaded: {archived}")
+            return
+
+        # Get available formats and check if it's a playlist; playlist entries are only listed here, so the
+        # ones already downloaded are never resolved
+        with yt_dlp.YoutubeDL(dict(ydl_opts, extract_flat='in_playlist')) as ydl:
+            archive.attach(ydl, 'video')
+            info_dict = extract_info(ydl, url, cache)
             if 'entries' in info_dict:  # This means it is a playlist
-                messagebox.showinfo("Playlist Detected", f"Detected a playlist with {len(info_dict['entries'])} videos.")
-                download_choice = messagebox.askyesno("Download Playlist", "Do you want to download the entire playlist?")
+                job.ask(messagebox.showinfo, "Playlist Detected", f"Detected a playlist with {len(info_dict['entries'])} videos.")
+                download_choice = job.ask(messagebox.askyesno, "Download Playlist", "Do you want to download the entire playlist?")
                 if download_choice:
-                    ydl.download([url])
-                    output_box.insert(tk.END, f"Downloaded playlist successfully to {save_path}\n")
+                    # A failed entry is reported and the rest of the playlist still downloads
+                    attempted = 0
+                    failed = 0
+                    for entry in info_dict['entries']:
+                        archived = archive.find(entry_key(entry), 'video', link_folder)
+                        if archived is not None:
+                            job.log(f"Already downloaded: {archived}")
+                            continue
+                        attempted += 1
+                        try:
+                            if download_info(ydl, extract_info(ydl, entry['url'], cache, entry_key(entry)), cache):
+                                continue
+                            error = "yt-dlp reported an error"
+                        except DownloadCancelled:
+                            raise
+                        except Exception as e:
+                            error = str(e)
+                        failed += 1
+                        job.log(f"Failed: {entry.get('title') or entry['url']}: {error}")
+                    job.log(f"Downloaded {attempted - failed} of {attempted} new playlist videos to {save_path}")
+                    if failed:
+                        raise RuntimeError(f"{failed} of {attempted} playlist videos failed")
                     return
                 else:
                     # List individual videos for user to choose
                     videos = [entry['title'] for entry in info_dict['entries']]
                     video_list = "\n".join([f"{idx + 1}. {title}" for idx, title in enumerate(videos)])
-                    choice = tk.simpledialog.askinteger("Select Video", f"Available videos:\n{video_list}\nEnter video number:")
+                    choice = job.ask(simpledialog.askinteger, "Select Video", f"Available videos:\n{video_list}\nEnter video number:")
                     if choice and 0 < choice <= len(info_dict['entries']):
-                        video_url = info_dict['entries'][choice - 1]['url']
-                        output_box.insert(tk.END, f"Downloading video: {info_dict['entries'][choice - 1]['title']}\n")
-                        ydl.download([video_url])
+                        entry = info_dict['entries'][choice - 1]
+                        archived = archive.find(entry_key(entry), 'video', link_folder)
+                        if archived is not None:
+                            job.log(f"Already downloaded: {archived}")
+                            return
+                        job.log(f"Downloading video: {entry['title']}")
+                        download_info(ydl, extract_info(ydl, entry['url'], cache, entry_key(entry)), cache)
                     else:
-                        messagebox.showwarning("Invalid Choice", "No valid video selected.")
+                        job.ask(messagebox.showwarning, "Invalid Choice", "No valid video selected.")
                     return
 
             formats = info_dict.get('formats', [])
             if not formats:
-                output_box.insert(tk.END, "No formats available for this video.\n")
+                job.log("No formats available for this video.")
                 return
 
             # Filter formats based on the file type
@@ -59,15 +128,15 @@ def download_best_format(url, base_path, file_type, output_box):
             elif file_type == 'Audio':
                 formats = [f for f in formats if f.get('acodec') != 'none']  # Only audio formats
             else:
-                output_box.insert(tk.END, "Invalid file type. Please choose 'Video' or 'Audio'.\n")
+                job.log("Invalid file type. Please choose 'Video' or 'Audio'.")
                 return
 
             # Display available formats
             format_list = [f"{i + 1}: {f.get('format_note', 'Quality not specified')} {f.get('resolution', 'No resolution')} - {f.get('ext', '')}" for i, f in enumerate(formats)]
             format_list_str = "\n".join(format_list)
-            choice = tk.simpledialog.askinteger("Select Format", f"Available formats:\n{format_list_str}\nChoose the format number:")
+            choice = job.ask(simpledialog.askinteger, "Select Format", f"Available formats:\n{format_list_str}\nChoose the format number:")
             if not choice or choice <= 0 or choice > len(formats):
-                output_box.insert(tk.END, "Invalid format choice.\n")
+                job.log("Invalid format choice.")
                 return
 
             chosen_format = formats[choice - 1]['format_id']
@@ -75,21 +144,182 @@ def download_best_format(url, base_path, file_type, output_box):
             # Update options for the chosen format
             ydl_opts['format'] = chosen_format
 
-        # Download with yt-dlp
+        # Download with yt-dlp, reusing the info dict resolved above instead of extracting the URL again
+        job.check_cancelled()
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            archive.attach(ydl, kind)
+            download_info(ydl, info_dict, cache)
 
-        output_box.insert(tk.END, f"Downloaded successfully to {save_path}\n")
+        job.log(f"Downloaded successfully to {save_path}")
 
+    except DownloadCancelled:
+        job.log(f"Cancelled {url}")
+        raise
     except Exception as e:
-        output_box.insert(tk.END, f"Error: {e}\n")
+        job.log(f"Error: {e}")
+        raise
+    finally:
+        cache.close()
+        archive.close()
+
+
+# Function to format a byte count for the job list
+def format_size(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+
+# One queued download. It runs on a worker thread and never touches Tk: logs, progress and dialogs are
+# posted to the engine, which handles them on the main thread
+class DownloadJob:
+    def __init__(self, engine, url, file_type):
+        self.engine = engine
+        self.url = url
+        self.file_type = file_type
+        self.cancelled = threading.Event()
+        self.future = None
+        self.row = None
+        self.last_progress = 0.0
+
+    def log(self, text):
+        self.engine.post('log', self, text)
+
+    def status(self, text):
+        self.engine.post('status', self, text)
+
+    # Show a dialog on the main thread and wait for the answer
+    def ask(self, dialog, *args):
+        reply = queue.Queue(maxsize=1)
+        self.engine.post('ask', self, (dialog, args, reply))
+        while True:
+            try:
+                return reply.get(timeout=0.2)
+            except queue.Empty:
+                self.check_cancelled()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise DownloadCancelled()
+
+    # yt-dlp progress hook; raising from it is how a running transfer is stopped
+    def progress_hook(self, d):
+        self.check_cancelled()
+        now = time.monotonic()
+        if d['status'] == 'downloading' and now - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = now
+            downloaded = d.get('downloaded_bytes') or 0
+            total = d.get('total_bytes') or d.get('total_bytes_estimate')
+            text = f"{downloaded / total:.0%} of {format_size(total)}" if total else format_size(downloaded)
+            if d.get('speed'):
+                text += f" at {format_size(d['speed'])}/s"
+            if d.get('eta') is not None:
+                text += f", {int(d['eta'])}s left"
+            self.engine.post('progress', self, text)
+        elif d['status'] == 'finished':
+            self.engine.post('progress', self, f"Finished {os.path.basename(d['filename'])}")
+
+
+# Runs downloads on a pool of worker threads. Workers only put events on a thread-safe queue, which the
+# Tk main loop drains every PUMP_INTERVAL_MS, so the window stays responsive while downloads run
+class DownloadEngine:
+    def __init__(self, root, output_box, job_list, base_path, workers=DOWNLOAD_WORKERS):
+        self.root = root
+        self.output_box = output_box
+        self.job_list = job_list
+        self.base_path = base_path
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.limiter = BandwidthLimiter(BANDWIDTH_LIMIT)
+        self.events = queue.Queue()
+        self.jobs = {}
+        # Dialogs wait their turn: only one is shown at a time
+        self.questions = []
+        self.asking = False
+        self.closed = False
+        self.root.after(PUMP_INTERVAL_MS, self.pump)
+
+    def submit(self, url, file_type):
+        job = DownloadJob(self, url, file_type)
+        job.row = self.job_list.insert('', tk.END, values=(url, file_type, 'Queued', ''))
+        self.jobs[job.row] = job
+        job.future = self.pool.submit(self.run, job)
+        return job
+
+    def run(self, job):
+        try:
+            job.check_cancelled()
+            job.status('Downloading')
+            job.log(f"Starting download for {job.url} as {job.file_type}...")
+            download_best_format(job.url, self.base_path, job.file_type, job)
+        except DownloadCancelled:
+            job.status('Cancelled')
+        except Exception:
+            job.status('Failed')
+        else:
+            job.status('Done')
+
+    def cancel(self, row):
+        job = self.jobs.get(row)
+        if job is None or job.future.done():
+            return
+        job.cancelled.set()
+        # A job still waiting for a worker never starts; a running one stops at its next progress update
+        if job.future.cancel():
+            self.job_list.set(row, 'status', 'Cancelled')
+        else:
+            self.job_list.set(row, 'status', 'Cancelling')
+
+    def post(self, kind, job, payload):
+        self.events.put((kind, job, payload))
+
+    # Main thread: apply the workers' events to the widgets
+    def pump(self):
+        if self.closed:
+            return
+        # Scheduled first: a modal dialog below keeps the event loop running, so the queue goes on draining
+        # (and other jobs' progress showing) while it is open
+        self.root.after(PUMP_INTERVAL_MS, self.pump)
+        while True:
+            try:
+                kind, job, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'log':
+                self.output_box.insert(tk.END, payload + "\n")
+                self.output_box.see(tk.END)
+            elif kind == 'status':
+                self.job_list.set(job.row, 'status', payload)
+            elif kind == 'progress':
+                self.job_list.set(job.row, 'progress', payload)
+            elif kind == 'ask':
+                self.questions.append((job, payload))
+        # Questions from jobs cancelled while they waited are dropped
+        self.questions = [(job, payload) for job, payload in self.questions if not job.cancelled.is_set()]
+        if self.questions and not self.asking:
+            job, (dialog, args, reply) = self.questions.pop(0)
+            # Pump calls made while the dialog is open must not open another
+            self.asking = True
+            try:
+                reply.put(dialog(*args, parent=self.root))
+            finally:
+                self.asking = False
+
+    # Cancel everything and release the workers before the window goes away
+    def close(self):
+        self.closed = True
+        for job in self.jobs.values():
+            job.cancelled.set()
+            if job.future is not None:
+                job.future.cancel()
+        self.pool.shutdown(wait=False)
 
 
 # GUI Setup
 def setup_gui():
     root = tk.Tk()
     root.title("YouTube Downloader")
-    root.geometry("600x400")
+    root.geometry("700x600")
 
     # URL Entry
     ttk.Label(root, text="YouTube URL:").grid(row=0, column=0, padx=10, pady=10, sticky=tk.W)
@@ -102,26 +332,47 @@ def setup_gui():
     file_type_combo.current(0)  # Default to "Video"
     file_type_combo.grid(row=1, column=1, padx=10, pady=10, sticky=tk.W)
 
+    # Download Queue: one row per URL with its status and progress
+    job_list = ttk.Treeview(root, columns=('url', 'type', 'status', 'progress'), show='headings', height=6)
+    for column, heading, width in (('url', "URL", 280), ('type', "Type", 60), ('status', "Status", 90), ('progress', "Progress", 220)):
+        job_list.heading(column, text=heading)
+        job_list.column(column, width=width)
+    job_list.grid(row=3, column=0, columnspan=2, padx=10, pady=5)
+
     # Output Text Box
-    output_box = scrolledtext.ScrolledText(root, width=70, height=15, wrap=tk.WORD)
-    output_box.grid(row=3, column=0, columnspan=2, padx=10, pady=10)
+    output_box = scrolledtext.ScrolledText(root, width=80, height=12, wrap=tk.WORD)
+    output_box.grid(row=5, column=0, columnspan=2, padx=10, pady=10)
 
     # Base Path for Downloads
     base_path = os.path.join(os.getcwd(), 'downloads')  # Default to 'downloads' in the current working directory
 
-    # Download Button
+    engine = DownloadEngine(root, output_box, job_list, base_path)
+
+    # Download Button: queues every URL in the entry and returns at once
     def start_download():
-        url = url_entry.get().strip()
+        urls = url_entry.get().split()
         file_type = file_type_combo.get()
-        if not url:
+        if not urls:
             messagebox.showwarning("Input Error", "Please enter a valid YouTube URL.")
             return
-        output_box.insert(tk.END, f"Starting download for {url} as {file_type}...\n")
-        output_box.see(tk.END)  # Scroll to the end of the output box
-        download_best_format(url, base_path, file_type, output_box)
+        for url in urls:
+            engine.submit(url, file_type)
+        url_entry.delete(0, tk.END)
+
+    # Cancel Button: stops the selected downloads
+    def cancel_download():
+        for row in job_list.selection():
+            engine.cancel(row)
+
+    def close():
+        engine.close()
+        root.destroy()
 
-    download_button = ttk.Button(root, text="Download", command=start_download)
-    download_button.grid(row=2, column=0, columnspan=2, pady=10)
+    buttons = ttk.Frame(root)
+    buttons.grid(row=2, column=0, columnspan=2, pady=10)
+    ttk.Button(buttons, text="Download", command=start_download).pack(side=tk.LEFT, padx=5)
+    ttk.Button(buttons, text="Cancel Selected", command=cancel_download).pack(side=tk.LEFT, padx=5)
+    root.protocol("WM_DELETE_WINDOW", close)
 
     root.mainloop()
 
@@ -4,6 +4,9 @@ from datetime import datetime
 from tqdm import tqdm
 from colorama import Fore, init
 import glob
+from yt_info_cache import InfoCache, INFO_CACHE_FILE, extract_info, download_info, entry_key, cache_key
+from yt_archive import DownloadArchive
+from yt_transfer import BandwidthLimiter, transfer_options, adopt_partials
 
 # Initialize colorama
 init(autoreset=True)
@@ -11,6 +14,14 @@ init(autoreset=True)
 # Global variable to keep track of progress
 progress_bar = None
 
+# Videos downloaded on an earlier day are skipped; set this to hard-link them into today's folder instead
+LINK_ARCHIVED = False
+
+# Transfer settings: fragments fetched at once per video, and a cap in bytes/sec on the download speed,
+# e.g. 5 * 1024 * 1024 (None for no cap)
+FRAGMENT_WORKERS = 8
+BANDWIDTH_LIMIT = None
+
 # Progress hook function to update the progress bar
 def progress_hook(d):
     global progress_bar
@@ -49,21 +60,39 @@ def download_best_format(url, base_path=os.path.expanduser('~/Desktop/Youtube Do
     save_path = os.path.join(base_path, today)
     os.makedirs(save_path, exist_ok=True)
 
+    # Resolved info dicts are reused across runs, so a repeat lookup or format listing needs no extraction
+    cache = InfoCache(os.path.join(base_path, INFO_CACHE_FILE))
+    # Videos finished on any earlier day, checked before anything is extracted or downloaded
+    archive = DownloadArchive(base_path)
+    link_folder = save_path if LINK_ARCHIVED else None
+    # Downloads interrupted on an earlier day are continued in today's folder
+    adopt_partials(base_path, save_path)
+    limiter = BandwidthLimiter(BANDWIDTH_LIMIT)
+    limiter.watch(save_path)
+
     # yt-dlp options to ensure proper downloading
     ydl_opts = {
         'outtmpl': f'{save_path}/%(title)s.%(ext)s',
-        'progress_hooks': [progress_hook],  # Hook for progress updates
+        'progress_hooks': [progress_hook, limiter.hook],  # Hooks for progress updates and the bandwidth cap
         'postprocessors': [{
             'key': 'FFmpegMerger',  # Ensures video and audio streams are merged
         }],
         'noplaylist': False,  # Do not auto-download playlists
         'keepvideo': True,  # Keep the video file after downloading
-        'merge_output_format': 'mp4'  # Ensure merging is done in MP4 format
+        'merge_output_format': 'mp4',  # Ensure merging is done in MP4 format
+        **transfer_options(FRAGMENT_WORKERS),  # Parallel fragments, resumable partial files
     }
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
+        archived = archive.find(cache_key(url), file_type, link_folder)
+        if archived is not None:
+            print(f"{Fore.GREEN}Already downloaded: {archived}")
+            return
+
+        # Playlist entries are only listed here, so the ones already downloaded are never resolved
+        with yt_dlp.YoutubeDL(dict(ydl_opts, extract_flat='in_playlist')) as ydl:
+            archive.attach(ydl)
+            info_dict = extract_info(ydl, url, cache)
 
             # Handle playlists
             if 'entries' in info_dict:  # Playlist detected
@@ -71,8 +100,24 @@ def download_best_format(url, base_path=os.path.expanduser('~/Desktop/Youtube Do
                 download_choice = input(f"{Fore.MAGENTA}Do you want to download the entire playlist? (yes/no): ").strip().lower()
 
                 if download_choice == 'yes':
-                    ydl.download([url])
-                    print(f"{Fore.GREEN}Downloaded playlist successfully to {save_path}")
+                    # A failed entry is reported and the rest of the playlist still downloads
+                    attempted = 0
+                    failed = 0
+                    for entry in info_dict['entries']:
+                        archived = archive.find(entry_key(entry), 'video', link_folder)
+                        if archived is not None:
+                            print(f"{Fore.CYAN}Already downloaded: {archived}")
+                            continue
+                        attempted += 1
+                        try:
+                            if download_info(ydl, extract_info(ydl, entry['url'], cache, entry_key(entry)), cache):
+                                continue
+                            error = "yt-dlp reported an error"
+                        except Exception as e:
+                            error = str(e)
+                        failed += 1
+                        print(f"{Fore.RED}Failed: {entry.get('title') or entry['url']}: {error}")
+                    print(f"{Fore.GREEN}Downloaded {attempted - failed} of {attempted} new playlist videos to {save_path}")
                     delete_webm_files(save_path)  # Delete .webm files after downloading
                     return
                 else:
@@ -81,9 +126,13 @@ def download_best_format(url, base_path=os.path.expanduser('~/Desktop/Youtube Do
                         print(f"{Fore.YELLOW}{idx}. {entry['title']}")
 
                     video_index = int(input(f"{Fore.MAGENTA}Enter the number of the video you want to download: ")) - 1
-                    video_url = info_dict['entries'][video_index]['url']
-                    print(f"{Fore.GREEN}Downloading video: {info_dict['entries'][video_index]['title']}")
-                    ydl.download([video_url])
+                    entry = info_dict['entries'][video_index]
+                    archived = archive.find(entry_key(entry), 'video', link_folder)
+                    if archived is not None:
+                        print(f"{Fore.GREEN}Already downloaded: {archived}")
+                        return
+                    print(f"{Fore.GREEN}Downloading video: {entry['title']}")
+                    download_info(ydl, extract_info(ydl, entry['url'], cache, entry_key(entry)), cache)
                     delete_webm_files(save_path)  # Delete .webm files after downloading
                     return
 
@@ -128,15 +177,18 @@ def download_best_format(url, base_path=os.path.expanduser('~/Desktop/Youtube Do
             else:
                 ydl_opts['format'] = chosen_format
 
-        # Download with yt-dlp
+        # Download with yt-dlp, reusing the info dict resolved above instead of extracting the URL again
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            archive.attach(ydl, file_type)
+            download_info(ydl, info_dict, cache)
 
         print(f"{Fore.GREEN}Downloaded successfully to {save_path}")
 
     except Exception as e:
         print(f"{Fore.RED}Error: {e}")
     finally:
+        cache.close()
+        archive.close()
         # Delete .webm files after processing
         delete_webm_files(save_path)
 
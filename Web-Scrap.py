@@ -1,16 +1,33 @@
-import requests
-from bs4 import BeautifulSoup
+import asyncio
 import os
-import pandas as pd
-import re
 import logging
-from time import sleep
 from random import choice
 import platform
+from scraper_fetch import AsyncFetcher, PaginationPlanner
+from scraper_extract import EXTRACTOR, FIELDS
+from scraper_cache import ResponseCache, shared_cache_path
+from scraper_index import ProductIndex, INDEX_FILE, write_changes
+from scraper_export import StreamingExporter, convert_to_excel
+from scraper_images import localize_images, IMAGE_PATH_FIELD
 
 # Set up logging
 logging.basicConfig(filename="scraper.log", level=logging.INFO, format="%(asctime)s - %(message)s")
 
+# Fetch settings: pages in flight, and the per-host request rate that replaces a fixed pause between pages
+CONCURRENCY = 8
+REQUESTS_PER_SECOND = 2.0
+MAX_RETRIES = 3
+PAGE_WINDOW = 8  # Pages fetched ahead while looking for the last one
+
+# Export settings: rows are streamed to disk in batches as pages complete, then optionally converted to Excel
+EXPORT_FORMAT = 'csv'  # csv, jsonl or parquet
+EXPORT_BATCH_SIZE = 500
+EXPORT_EXCEL = True
+
+# Optional image stage: download each distinct product image once and add its local path to the export
+DOWNLOAD_IMAGES = False
+IMAGE_THUMBNAILS = False
+
 # List of common User-Agent headers to rotate through (to avoid being blocked)
 user_agents = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36",
@@ -20,62 +37,38 @@ user_agents = [
 ]
 
 # Function to scrape a single page
-def scrape_page(url):
+async def scrape_page(fetcher, url):
     # Use random User-Agent to avoid being blocked
     headers = {"User-Agent": choice(user_agents)}
-    response = requests.get(url, headers=headers)
-
-    # Lists to store scraped data
-    product_names = []
-    product_prices = []
-    product_descriptions = []
-    product_model_numbers = []
-    image_urls = []
+    response = await fetcher.get(url, headers=headers)
 
     # Check if the request was successful
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.text, 'html.parser')
-
-        # Use regex to find any class or id that may represent a product container
-        product_containers = soup.find_all(True, {'class': re.compile(r'(product|item)', re.IGNORECASE)})
-
-        if not product_containers:
-            print("No products found on the page. Please check the HTML structure.")
-
-        for product in product_containers:
-            # Extract product name
-            name = product.find(re.compile(r'h\d'), class_=re.compile(r'(name|title)', re.IGNORECASE))
-            product_names.append(name.text.strip() if name else 'N/A')
-
-            # Extract product price
-            price = product.find('span', class_=re.compile(r'(price|amount)', re.IGNORECASE))
-            product_prices.append(price.text.strip() if price else 'N/A')
-
-            # Extract product description
-            description = product.find('p', class_=re.compile(r'(description|detail)', re.IGNORECASE))
-            product_descriptions.append(description.text.strip() if description else 'N/A')
-
-            # Extract model number
-            model = product.find('span', class_=re.compile(r'(model|sku)', re.IGNORECASE))
-            product_model_numbers.append(model.text.strip() if model else 'N/A')
-
-            # Extract image URL
-            img = product.find('img', class_=re.compile(r'(image|img|photo)', re.IGNORECASE))
-            img_url = img.get('src') if img else 'N/A'
+    if response is not None and response.status == 200:
+        # The page is unchanged since the last crawl, so its earlier parse result still holds
+        if response.not_modified:
+            parsed = fetcher.cache.get_parsed(url)
+            if parsed is not None:
+                rows, next_link = parsed
+                return [tuple(row) for row in rows], next_link
+
+        # Parse in a worker thread so other downloads keep moving
+        rows, next_link = await asyncio.to_thread(parse_page, response.text, url)
+        if fetcher.cache is not None:
+            fetcher.cache.put_parsed(url, [rows, next_link])
+        return rows, next_link
+    else:
+        status = response.status if response is not None else 'no response'
+        logging.error(f"Failed to retrieve content from {url}. Status code: {status}")
+        return [], None
 
-            # Filter out base64-encoded images (data URLs)
-            if img_url != 'N/A' and not img_url.startswith('data:image'):
-                if not img_url.startswith('http'):
-                    img_url = url + img_url
-                image_urls.append(img_url)
-            else:
-                image_urls.append('N/A')
+# Function to extract product data from a page's HTML; returns one row per product and the page's "next" link
+def parse_page(html, url):
+    rows, next_link = EXTRACTOR.extract(html, url)
 
-        return product_names, product_prices, product_descriptions, product_model_numbers, image_urls
+    if not rows:
+        logging.info(f"No products found on {url}")
 
-    else:
-        logging.error(f"Failed to retrieve content from {url}. Status code: {response.status_code}")
-        return [], [], [], [], []
+    return rows, next_link
 
 # Function to determine the desktop path based on OS
 def get_desktop_path():
@@ -84,73 +77,111 @@ def get_desktop_path():
     else:
         return os.path.join(os.path.expanduser("~"), "Desktop")
 
-# Ask the user to input the website URL
-url = input("Please enter the website URL to scrape: ")
-
-# Create a folder named "Website Data" on the Desktop
-desktop_path = get_desktop_path()
-data_folder = os.path.join(desktop_path, "Website Data")
-
-if not os.path.exists(data_folder):
-    os.makedirs(data_folder)
-
-# Generate a folder name based on the website URL (use domain name)
-website_name = url.split("//")[-1].split("/")[0]  # Extract the domain name
-website_folder_path = os.path.join(data_folder, website_name)
-
-# Create a folder for the individual website
-if not os.path.exists(website_folder_path):
-    os.makedirs(website_folder_path)
-
-# Pagination support
-page = 1
-all_product_names = []
-all_product_prices = []
-all_product_descriptions = []
-all_product_model_numbers = []
-all_image_urls = []
-
-while True:
-    paginated_url = f"{url}?page={page}"
-    logging.info(f"Scraping page {page} - {paginated_url}")
-
-    names, prices, descriptions, models, images = scrape_page(paginated_url)
-
-    if not names:  # If no products are found on the current page, exit the loop
-        print(f"Completed scraping. Total pages scraped: {page - 1}")
-        break
-
-    # Append current page data to global lists
-    all_product_names.extend(names)
-    all_product_prices.extend(prices)
-    all_product_descriptions.extend(descriptions)
-    all_product_model_numbers.extend(models)
-    all_image_urls.extend(images)
-
-    # Progress display
-    print(f"Page {page} scraped. {len(names)} products found.")
-    logging.info(f"Page {page} scraped. {len(names)} products found.")
-
-    # Wait between requests to avoid overloading the server
-    sleep(2)  # Pause for 2 seconds between requests
-
-    # Move to the next page
-    page += 1
-
-# Prepare data for export to Excel
-data = {
-    'Product Name': all_product_names if all_product_names else ['N/A'],
-    'Price': all_product_prices if all_product_prices else ['N/A'],
-    'Description': all_product_descriptions if all_product_descriptions else ['N/A'],
-    'Model Number': all_product_model_numbers if all_product_model_numbers else ['N/A'],
-    'Image URLs': all_image_urls if all_image_urls else ['N/A'],
-}
-
-# Convert to a DataFrame
-df = pd.DataFrame(data)
-
-# Save the Excel file in the website's folder
-output_file = os.path.join(website_folder_path, 'scraped_product_data.xlsx')
-df.to_excel(output_file, index=False)
-
-print(f"\nProduct data successfully exported to {output_file}")
+# Function to crawl ?page=1,2,3... (or the "next" links) until a page yields no products, streaming
+# the rows to the exporter; with a product index it also returns the new, changed and removed products.
+# Pass a shared fetcher to crawl several sites under one connection pool and concurrency cap.
+async def crawl(url, exporter, cache=None, index=None, fetcher=None, verbose=True):
+    if fetcher is None:
+        # The fetcher's per-host rate limit replaces the fixed pause between pages
+        async with AsyncFetcher(concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND, max_retries=MAX_RETRIES, cache=cache) as fetcher:
+            return await crawl(url, exporter, cache, index, fetcher, verbose)
+
+    changes = []
+    page = 0
+    if index is not None:
+        index.begin_run()
+
+    planner = PaginationPlanner(lambda page_url: scrape_page(fetcher, page_url), window=PAGE_WINDOW)
+    async for page_url, rows in planner.pages(url):
+        page += 1
+        written = exporter.write_page(page_url, rows)
+        if index is not None:
+            changes.extend(index.record_page(page_url, rows))
+
+        # Progress display
+        if written:
+            logging.info(f"Page {page} scraped - {page_url}. {len(rows)} products found.")
+            if verbose:
+                print(f"Page {page} scraped. {len(rows)} products found.")
+        elif verbose:
+            print(f"Page {page} already exported by the interrupted run, skipping.")
+
+    if verbose:
+        if page == 0:
+            print("No products found on the page. Please check the HTML structure.")
+        print(f"Completed scraping. Total pages scraped: {page}")
+    logging.info(f"Finished {url}: {page} pages; cancelled {planner.cancelled} speculative page requests past the last page")
+    if cache is not None:
+        logging.info(f"Response cache: {cache.revalidated} pages unchanged since the last crawl")
+
+    # A crawl cut short by a failed request says nothing about the products after it
+    complete = planner.end_url not in fetcher.failed
+    if not complete:
+        if verbose:
+            print(f"Stopped at {planner.end_url}, which could not be fetched. Run again to resume from there.")
+        logging.warning(f"Crawl stopped at failed page {planner.end_url}; not reporting removed products")
+
+    if index is not None:
+        changes.extend(index.finish_run(remove=complete))
+
+    # Only a finished crawl closes the export; otherwise its checkpoint lets the next run resume
+    if complete:
+        exporter.close()
+    else:
+        exporter.flush()
+    return changes
+
+def main():
+    # Ask the user to input the website URL
+    url = input("Please enter the website URL to scrape: ")
+
+    # Create a folder named "Website Data" on the Desktop
+    desktop_path = get_desktop_path()
+    data_folder = os.path.join(desktop_path, "Website Data")
+
+    if not os.path.exists(data_folder):
+        os.makedirs(data_folder)
+
+    # Generate a folder name based on the website URL (use domain name)
+    website_name = url.split("//")[-1].split("/")[0]  # Extract the domain name
+    website_folder_path = os.path.join(data_folder, website_name)
+
+    # Create a folder for the individual website
+    if not os.path.exists(website_folder_path):
+        os.makedirs(website_folder_path)
+
+    # Rows go to disk batch by batch; an interrupted crawl resumes from the last checkpoint
+    exporter = StreamingExporter(website_folder_path, fmt=EXPORT_FORMAT, batch_size=EXPORT_BATCH_SIZE)
+    if exporter.resumed:
+        print(f"Resuming an interrupted crawl: {exporter.rows_written} products already exported.")
+    # Pages from earlier runs are kept here and revalidated instead of downloaded again
+    cache = ResponseCache(shared_cache_path())
+    # Products seen on earlier runs of this site, to report only what changed
+    index = ProductIndex(os.path.join(website_folder_path, INDEX_FILE))
+    try:
+        changes = asyncio.run(crawl(url, exporter, cache, index))
+    finally:
+        # Pages finished before an error or Ctrl+C are kept for the next run
+        exporter.flush()
+        cache.close()
+        index.close()
+
+    changes_file = write_changes(changes, website_folder_path)
+    print(f"{index.counts['new']} new, {index.counts['changed']} changed and {index.counts['removed']} removed products "
+          f"({index.counts['skipped_pages']} pages unchanged). Changes written to {changes_file}")
+
+    print(f"\n{exporter.rows_written} products exported to {exporter.path}")
+
+    fields = FIELDS
+    if DOWNLOAD_IMAGES and exporter.state['complete']:
+        downloader = asyncio.run(localize_images(exporter.path, exporter.fmt, website_folder_path, IMAGE_THUMBNAILS))
+        print(downloader.summary())
+        fields = FIELDS + (IMAGE_PATH_FIELD,)
+
+    # Excel is an optional final step, converted from the streamed export
+    if EXPORT_EXCEL:
+        output_file = convert_to_excel(exporter.path, exporter.fmt, os.path.join(website_folder_path, 'scraped_product_data.xlsx'), fields)
+        print(f"Product data successfully exported to {output_file}")
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,21 @@
+import os
+import math
+import time
+import json
+import queue
+import random
+import bisect
+import hashlib
+import asyncio
+import argparse
 import cv2
 import numpy as np
 import torch
-from threading import Thread
-
-# Load the YOLOv5 model
-model = torch.hub.load('ultralytics/yolov5', 'yolov5s', pretrained=True)
-model.conf = 0.5  # Confidence threshold
+import torchvision
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from threading import Thread, Condition, Lock, Event
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Define your RTSP streams
 streams = [
@@ -20,64 +30,1097 @@ rows = 2
 cols = 2
 window_name = "YOLOv5 Detection on Multiple Streams (CUDA Optimized)"
 
-# Function to fetch and process frames from each stream
-def fetch_and_detect(stream_url, frames_dict, idx):
-    # Use OpenCV's VideoCapture with CUDA backend
-    cap = cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
-    if not cap.isOpened():
-        print(f"Failed to open stream: {stream_url}")
-        return
+# Model settings
+WEIGHTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "best.pt")  # Falls back to yolov5s if missing
+YOLOV5_REPO = "ultralytics/yolov5"
+MODEL_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "multy-stream-yolo")
+MODEL_IMAGE_SIZE = 640  # Square input size the cached TorchScript model is traced at
+CONF_THRESHOLD = 0.5
+IOU_THRESHOLD = 0.45  # Non-maximum suppression overlap threshold
+MAX_DETECTIONS = 300  # Per frame
+WARMUP_RUNS = 2  # Dummy batches run through the model before the streams start
+
+# Batched inference settings
+MAX_BATCH_SIZE = 16  # Maximum number of stream frames per forward pass
+MAX_BATCH_WAIT = 0.02  # Seconds to wait for more streams before running a partial batch
+
+# Capture settings
+FRAME_WIDTH, FRAME_HEIGHT = 640, 480  # Every stream is resized to this before inference
+RING_SIZE = 3  # Decoded frames kept per stream; older frames are overwritten
+
+# Preprocessing settings
+PREPROCESS_BACKEND = "auto"  # "cuda", "cpu", or "auto" to use CUDA when this OpenCV build supports it
+LETTERBOX_COLOR = 114  # Padding value YOLOv5 was trained with
+
+# Box colors (BGR) cycled by class index
+PALETTE = [(56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+           (10, 249, 72), (23, 204, 146), (134, 219, 61), (211, 188, 52), (255, 194, 0)]
+
+# Reconnect settings
+OPEN_TIMEOUT = 10.0  # Seconds FFmpeg may spend opening a stream
+READ_TIMEOUT = 10.0  # Seconds a single read may block before it fails
+STALL_TIMEOUT = 15.0  # Seconds without a decoded frame before a live stream is reported as stalled
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0  # Upper bound of the exponential backoff, so a dead stream costs next to no CPU
+SUPERVISOR_INTERVAL = 1.0  # Seconds between stream health checks
+
+# Motion gating settings
+MOTION_SIZE = (160, 120)  # Grayscale resolution used for motion detection
+MOTION_THRESHOLD = 25  # Difference from the background model that marks a pixel as changed
+MOTION_MIN_AREA = 0.002  # Fraction of changed pixels that counts as motion
+MOTION_ALPHA = 0.05  # How quickly the background model follows the scene
+KEEPALIVE_INTERVAL = 2.0  # Seconds between inferences on a stream without motion
+
+# Instrumentation settings
+STATS_INTERVAL = 30.0  # Seconds between summary log lines; 0 disables them
+METRICS_PORT = 0  # Port of the Prometheus endpoint in desktop mode; 0 disables it (headless serves /metrics)
+LATENCY_BUCKETS = tuple(0.0001 * 1.5 ** i for i in range(30))  # Histogram bounds from 0.1 ms to ~19 s
+
+# Execution settings
+NUM_WORKERS = 0  # Detection worker processes; 0 runs everything as threads in this process
+
+# Headless service settings
+API_HOST = "0.0.0.0"
+API_PORT = 8080
+MQTT_HOST = "127.0.0.1"  # Same broker as the mqtt.host written by Config-yaml-RTSP-FRIGATE.py
+MQTT_PORT = 1883
+MQTT_TOPIC = "yolo/{stream}/detections"
+
+# Columns of the per-stream statistics array
+STAT_CAPTURED, STAT_DROPPED, STAT_PROCESSED, STAT_FRAME_AGE, STAT_SKIPPED, STAT_HEALTH, STAT_RECONNECTS, \
+    STAT_BACKLOG = range(8)
+NUM_STATS = 8
+
+# Timed pipeline stages
+STAGE_DECODE, STAGE_RESIZE, STAGE_INFERENCE, STAGE_RENDER, STAGE_COMPOSE = range(5)
+STAGE_NAMES = ("decode", "resize", "inference", "render", "compose")
+
+# Stream health states, stored in the statistics array by index
+HEALTH_CONNECTING, HEALTH_LIVE, HEALTH_STALLED, HEALTH_RECONNECTING = range(4)
+HEALTH_STATES = ("connecting", "live", "stalled", "reconnecting")
+
+# Function to find the YOLOv5 code, preferring a local checkout so no network access is needed
+def resolve_yolov5_repo(repo=None):
+    if repo:
+        return repo, 'local'
+
+    # torch.hub keeps a checkout of the repo after the first online load
+    cached_repo = os.path.join(torch.hub.get_dir(), 'ultralytics_yolov5_master')
+    if os.path.isfile(os.path.join(cached_repo, 'hubconf.py')):
+        return cached_repo, 'local'
+    return YOLOV5_REPO, 'github'
+
+# Function to hash a weights file so cached exports are invalidated when the weights change
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to pick the device the model runs on: the first GPU when there is one, as YOLOv5 does by default
+def inference_device():
+    return torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+
+# Function to export local weights to TorchScript once and reuse the export on later starts. The trace is
+# tied to one device, so it is made on the device the model will run on, which is part of the cache key
+def prepare_weights(weights, repo, source, cache_dir=MODEL_CACHE_DIR, imgsz=MODEL_IMAGE_SIZE, device=None):
+    if not weights or not os.path.isfile(weights):
+        return None
+
+    device = torch.device(device) if device is not None else inference_device()
+    stem = os.path.splitext(os.path.basename(weights))[0]
+    cached = os.path.join(cache_dir, f"{stem}-{file_sha256(weights)[:16]}-{imgsz}-{str(device).replace(':', '')}.torchscript")
+    if os.path.isfile(cached):
+        return cached
+
+    print(f"Exporting {weights} to {cached}...")
+    try:
+        net = torch.hub.load(repo, 'custom', path=weights, source=source, device=str(device)).model.model
+        export_torchscript(net, cached, device, imgsz)
+        return cached
+    except Exception as e:
+        print(f"TorchScript export failed ({e}), using {weights} directly")
+        return weights
+
+# Function to trace a YOLOv5 network on a device and save it with the metadata YOLOv5 reads back
+def export_torchscript(net, path, device, imgsz=MODEL_IMAGE_SIZE):
+    net = net.to(device).float().eval()
+    for module in net.modules():
+        if type(module).__name__ == 'Detect':
+            module.export = True  # Return only the prediction tensor, like YOLOv5's export.py
+
+    # Detect builds its grids on the example's device, and the trace keeps that device
+    example = torch.zeros(1, 3, imgsz, imgsz, device=device)
+    traced = torch.jit.trace(net, example, strict=False)
+
+    # YOLOv5 reads stride and class names for TorchScript models from this embedded file
+    names = net.names if isinstance(net.names, dict) else dict(enumerate(net.names))
+    config = {'shape': list(example.shape), 'stride': int(max(net.stride)), 'names': names}
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    traced.save(tmp_path, _extra_files={'config.txt': json.dumps(config)})
+    os.replace(tmp_path, path)
+
+# Function to check whether this OpenCV build can run CUDA kernels
+def cuda_resize_available():
+    try:
+        return cv2.cuda.getCudaEnabledDeviceCount() > 0
+    except (AttributeError, cv2.error):
+        return False
+
+# Resizes decoded frames to the stream frame size, on the GPU or the CPU
+class FrameResizer:
+    def __init__(self, backend):
+        self.backend = backend
+        if backend == 'cuda':
+            # Initialize CUDA objects once per stream
+            self.gpu_frame = cv2.cuda_GpuMat()
+            self.gpu_resized = cv2.cuda_GpuMat()
+
+    def resize(self, frame, out):
+        if frame.shape == out.shape:
+            np.copyto(out, frame)
+        elif self.backend == 'cuda':
+            # Resize on the GPU and download straight into out
+            self.gpu_frame.upload(frame)
+            cv2.cuda.resize(self.gpu_frame, (FRAME_WIDTH, FRAME_HEIGHT), self.gpu_resized)
+            self.gpu_resized.download(out)
+        else:
+            cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT), dst=out, interpolation=cv2.INTER_LINEAR)
+
+# Letterboxes and normalizes a batch of frames into a preallocated model input tensor
+class BatchPreprocessor:
+    def __init__(self, max_batch, input_size, device=torch.device('cpu'), half=False):
+        in_h, in_w = input_size
+        self.device = device
+        self.half = half
+        self.scale = min(in_h / FRAME_HEIGHT, in_w / FRAME_WIDTH)
+        self.resized_w = round(FRAME_WIDTH * self.scale)
+        self.resized_h = round(FRAME_HEIGHT * self.scale)
+        self.pad_left = (in_w - self.resized_w) // 2
+        self.pad_top = (in_h - self.resized_h) // 2
+
+        # The padding is filled once; each batch only overwrites the image area
+        self.input = torch.full((max_batch, 3, in_h, in_w), LETTERBOX_COLOR / 255, dtype=torch.float32,
+                                pin_memory=device.type == 'cuda')
+        self.image_area = self.input[:, :, self.pad_top:self.pad_top + self.resized_h,
+                                     self.pad_left:self.pad_left + self.resized_w]
+        self.resize_buffer = None
+        if (self.resized_w, self.resized_h) != (FRAME_WIDTH, FRAME_HEIGHT):
+            self.resize_buffer = np.empty((max_batch, self.resized_h, self.resized_w, 3), dtype=np.uint8)
+
+    # frames is a (batch, height, width, 3) BGR uint8 array; returns the model input for the first n frames
+    def __call__(self, frames, n):
+        if self.resize_buffer is not None:
+            for i in range(n):
+                cv2.resize(frames[i], (self.resized_w, self.resized_h), dst=self.resize_buffer[i],
+                           interpolation=cv2.INTER_LINEAR)
+            frames = self.resize_buffer
+
+        # One strided copy per channel converts the whole batch from BGR HWC uint8 to RGB CHW float
+        source = torch.from_numpy(frames[:n])
+        target = self.image_area[:n]
+        for channel in range(3):
+            target[:, channel].copy_(source[..., 2 - channel])
+        target.mul_(1 / 255)
+
+        batch = self.input[:n].to(self.device, non_blocking=True)
+        return batch.half() if self.half else batch
+
+    # Map boxes from model input coordinates back onto the stream frame, in place
+    def scale_boxes(self, detections):
+        detections[:, [0, 2]] -= self.pad_left
+        detections[:, [1, 3]] -= self.pad_top
+        detections[:, :4] /= self.scale
+        detections[:, [0, 2]] = detections[:, [0, 2]].clamp(0, FRAME_WIDTH)
+        detections[:, [1, 3]] = detections[:, [1, 3]].clamp(0, FRAME_HEIGHT)
+        return detections
+
+# Function to choose the model input size for the stream frame size
+def model_input_size(network, imgsz=MODEL_IMAGE_SIZE):
+    if not getattr(network, 'pt', True):
+        return imgsz, imgsz  # Exported models only accept the square size they were traced at
+
+    # PyTorch weights take a rectangular input, as long as both sides are multiples of the stride
+    stride = int(getattr(network, 'stride', 32))
+    gain = imgsz / max(FRAME_WIDTH, FRAME_HEIGHT)
+    return (math.ceil(FRAME_HEIGHT * gain / stride) * stride,
+            math.ceil(FRAME_WIDTH * gain / stride) * stride)
+
+# Function to turn raw YOLOv5 predictions (xywh, objectness, class scores) into (x1, y1, x2, y2, conf, cls) per frame
+def non_max_suppression(predictions, conf_threshold, iou_threshold=IOU_THRESHOLD, max_det=MAX_DETECTIONS):
+    output = []
+    for prediction in predictions:
+        prediction = prediction[prediction[:, 4] > conf_threshold]
+        scores, classes = (prediction[:, 5:] * prediction[:, 4:5]).max(1)
+        keep = scores > conf_threshold
+        prediction, scores, classes = prediction[keep], scores[keep], classes[keep]
+
+        boxes = torch.empty_like(prediction[:, :4])
+        boxes[:, :2] = prediction[:, :2] - prediction[:, 2:4] / 2
+        boxes[:, 2:] = prediction[:, :2] + prediction[:, 2:4] / 2
+        keep = torchvision.ops.batched_nms(boxes, scores, classes, iou_threshold)[:max_det]
+        output.append(torch.cat((boxes[keep], scores[keep, None], classes[keep, None].float()), 1).float())
+    return output
+
+# Function to draw detection boxes and labels onto a frame in place
+def draw_detections(frame, detections, names):
+    for x1, y1, x2, y2, conf, cls in detections:
+        color = PALETTE[int(cls) % len(PALETTE)]
+        cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
+        cv2.putText(frame, f"{names[int(cls)]} {conf:.2f}", (int(x1), max(int(y1) - 5, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+
+# Function to compare the preprocessing backends available on this host
+def benchmark_preprocessing(batch_size, iterations=50):
+    source = np.random.randint(0, 256, (1080, 1920, 3), dtype=np.uint8)  # A typical 1080p camera frame
+    frames = np.zeros((batch_size, FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+    preprocessor = BatchPreprocessor(batch_size, model_input_size(None))
+
+    backends = ['cpu'] + (['cuda'] if cuda_resize_available() else [])
+    for backend in backends:
+        resizer = FrameResizer(backend)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for i in range(batch_size):
+                resizer.resize(source, frames[i])
+        resize_ms = (time.perf_counter() - start) * 1000 / (iterations * batch_size)
+        print(f"{backend}: resize {resize_ms:.2f} ms/frame")
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        preprocessor(frames, batch_size)
+    tensor_ms = (time.perf_counter() - start) * 1000 / iterations
+    print(f"batch tensor (batch of {batch_size}): {tensor_ms:.2f} ms/batch, {tensor_ms / batch_size:.2f} ms/frame")
+
+# Function to load the YOLOv5 model and warm it up at the batch size it will run at,
+# on the device the export was traced for
+def load_model(model_path, repo, source, device=None, warmup_batch=1, warmup_runs=WARMUP_RUNS):
+    device = str(device if device is not None else inference_device())
+    if model_path:
+        model = torch.hub.load(repo, 'custom', path=model_path, source=source, device=device)
+    else:
+        model = torch.hub.load(repo, 'yolov5s', pretrained=True, source=source, device=device)
+    model.conf = CONF_THRESHOLD
+
+    # The first forward passes allocate buffers and pick kernels; do that before frames arrive
+    warmup_frames = [np.zeros((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)] * warmup_batch
+    for _ in range(warmup_runs):
+        model(warmup_frames)
+    return model
+
+# Function to create a numpy array backed by shared memory, or attach to an existing one by name
+def shared_array(shape, dtype, name=None):
+    if name is None:
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=size)
+    else:
+        shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shm, array
+
+# Latency histograms per stream and stage, in shared memory so worker processes record into them directly
+class StageTimings:
+    def __init__(self, num_streams, names=None):
+        counts_shape = (num_streams, len(STAGE_NAMES), len(LATENCY_BUCKETS) + 1)  # Last bucket is +Inf
+        sums_shape = (num_streams, len(STAGE_NAMES))
+        counts_name, sums_name = names or (None, None)
+        self.counts_shm, self.counts = shared_array(counts_shape, np.int64, counts_name)
+        self.sums_shm, self.sums = shared_array(sums_shape, np.float64, sums_name)
+        self.names = (self.counts_shm.name, self.sums_shm.name)
+        if names is None:
+            self.counts[:] = 0
+            self.sums[:] = 0
+
+    # Each stream and stage is recorded by a single thread, so no locking is needed
+    def record(self, idx, stage, seconds):
+        self.counts[idx, stage, bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.sums[idx, stage] += seconds
+
+    def close(self):
+        self.counts = self.sums = None
+        self.counts_shm.close()
+        self.sums_shm.close()
+
+    def unlink(self):
+        self.counts_shm.unlink()
+        self.sums_shm.unlink()
+
+# Function to estimate a quantile from histogram bucket counts; returns the upper bound of its bucket
+def histogram_quantile(counts, q):
+    total = counts.sum()
+    if total == 0:
+        return 0.0
+    bucket = int(np.searchsorted(np.cumsum(counts), q * total))
+    return LATENCY_BUCKETS[bucket] if bucket < len(LATENCY_BUCKETS) else float('inf')
+
+# Preallocated grid of stream tiles in shared memory; each tile is guarded by a seqlock version counter
+class SharedMosaic:
+    def __init__(self, num_streams, name=None):
+        self.num_streams = num_streams
+        self.shape = (rows * FRAME_HEIGHT, cols * FRAME_WIDTH, 3)
+        header_size = num_streams * np.dtype(np.int64).itemsize
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_size + int(np.prod(self.shape)))
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        # Versions are odd while a tile is being written and even once it is complete
+        self.versions = np.ndarray((num_streams,), dtype=np.int64, buffer=self.shm.buf)
+        self.grid = np.ndarray(self.shape, dtype=np.uint8, buffer=self.shm.buf, offset=header_size)
+        self.tiles = [tile_view(self.grid, idx) for idx in range(num_streams)]
+        if name is None:
+            self.versions[:] = 0
+            self.grid[:] = 0
+
+    # Each tile has exactly one writer: the scheduler that owns the stream
+    def write(self, idx, frame):
+        self.versions[idx] += 1
+        np.copyto(self.tiles[idx], frame)
+        self.versions[idx] += 1
+
+    # Copy a tile into out; returns the version copied, or None if every attempt raced a writer
+    def read(self, idx, out, attempts=3):
+        for _ in range(attempts):
+            version = int(self.versions[idx])
+            if version % 2:
+                continue
+            np.copyto(out, self.tiles[idx])
+            if self.versions[idx] == version:
+                return version
+        return None
+
+    def close(self):
+        # Drop the numpy views before releasing the shared memory they point into
+        self.versions = self.grid = self.tiles = None
+        self.shm.close()
+
+    def unlink(self):
+        self.shm.unlink()
+
+# Function to get the view of a stream's tile inside a grid
+def tile_view(grid, idx):
+    r, c = divmod(idx, cols)  # Get row and column in the grid
+    return grid[r * FRAME_HEIGHT:(r + 1) * FRAME_HEIGHT, c * FRAME_WIDTH:(c + 1) * FRAME_WIDTH]
+
+# Cheap motion detector comparing a downscaled grayscale frame against a running-average background
+class MotionGate:
+    def __init__(self, size=MOTION_SIZE, threshold=MOTION_THRESHOLD, min_area=MOTION_MIN_AREA, alpha=MOTION_ALPHA):
+        self.size = size
+        self.threshold = threshold
+        self.min_changed = max(1, int(min_area * size[0] * size[1]))
+        self.alpha = alpha
+
+        # Work buffers are allocated once and reused for every frame
+        self.small = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.gray = np.empty((size[1], size[0]), dtype=np.uint8)
+        self.diff = np.empty((size[1], size[0]), dtype=np.float32)
+        self.changed = np.empty((size[1], size[0]), dtype=bool)
+        self.background = None
+
+    # Returns True when enough of the frame differs from the background
+    def update(self, frame):
+        cv2.resize(frame, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self.small, cv2.COLOR_BGR2GRAY, dst=self.gray)
+        if self.background is None:
+            self.background = self.gray.astype(np.float32)
+            return True
+
+        np.subtract(self.gray, self.background, out=self.diff)
+        np.greater(np.abs(self.diff), self.threshold, out=self.changed)
+        self.diff *= self.alpha
+        self.background += self.diff
+        return np.count_nonzero(self.changed) >= self.min_changed
+
+# Dedicated reader per stream that keeps only the newest decoded frames in a preallocated ring buffer
+class FrameGrabber(Thread):
+    def __init__(self, idx, stream_url, frame_ready, counters, timings, resizer, motion_gate=None,
+                 keepalive=KEEPALIVE_INTERVAL, ring_size=RING_SIZE):
+        super().__init__(daemon=True)
+        self.idx = idx
+        self.stream_url = stream_url
+        self.timings = timings
+        self.resizer = resizer
+        self.frame_ready = frame_ready  # Condition shared with the scheduler
+        self.counters = counters  # This stream's row of the statistics array
+        self.motion_gate = motion_gate  # None runs inference on every frame
+        self.keepalive = keepalive
+        self.motion_pending = True  # Motion seen since the last frame handed to inference
+        self.last_inference = 0.0
+        self.last_frame = 0.0  # Monotonic time of the last decoded frame
+        self.ring = np.zeros((max(2, ring_size), FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+        self.capture_times = np.zeros(len(self.ring))
+        self.write_slot = 0
+        self.latest_slot = 0
+        self.latest_seq = 0
+        self.consumed_seq = 0
+        self.lock = Lock()
+
+    # Keep the stream open, reconnecting with exponential backoff and jitter whenever it fails
+    def run(self):
+        failures = 0
+        while True:
+            self.counters[STAT_HEALTH] = HEALTH_CONNECTING
+            cap = open_capture(self.stream_url)
+            if cap.isOpened():
+                if self.read_frames(cap):
+                    failures = 0  # The stream worked, so start the backoff over
+                cap.release()
+            else:
+                print(f"Failed to open stream: {self.stream_url}")
+
+            failures += 1
+            delay = reconnect_delay(failures)
+            self.counters[STAT_HEALTH] = HEALTH_RECONNECTING
+            self.counters[STAT_RECONNECTS] += 1
+            print(f"Reconnecting to {self.stream_url} in {delay:.1f}s (attempt {failures})")
+            time.sleep(delay)
+
+    # Read until the stream fails; returns True if any frame was decoded
+    def read_frames(self, cap):
+        received = False
+        while True:
+            # Decode time includes waiting for the camera to deliver the next frame
+            started = time.perf_counter()
+            ret, frame = cap.read()
+            if not ret:
+                return received
+            decoded = time.perf_counter()
+            captured_at = time.monotonic()
+            self.last_frame = captured_at
+            received = True
+            if self.counters[STAT_HEALTH] != HEALTH_LIVE:
+                self.counters[STAT_HEALTH] = HEALTH_LIVE  # Also clears a stall reported by the supervisor
+
+            # Resize straight into the next ring slot
+            slot = self.write_slot
+            self.resizer.resize(frame, self.ring[slot])
+            motion = self.motion_gate is None or self.motion_gate.update(self.ring[slot])
+            self.timings.record(self.idx, STAGE_DECODE, decoded - started)
+            self.timings.record(self.idx, STAGE_RESIZE, time.perf_counter() - decoded)
+
+            # Publish the slot; the writer never touches the published slot, so readers see whole frames
+            with self.lock:
+                if self.latest_seq > self.consumed_seq:
+                    if self.wants_inference(captured_at):
+                        self.counters[STAT_DROPPED] += 1  # Overwritten before inference picked it up
+                    else:
+                        self.counters[STAT_SKIPPED] += 1  # Static scene, inference not needed
+                self.motion_pending = self.motion_pending or motion
+                self.capture_times[slot] = captured_at
+                self.latest_slot = slot
+                self.latest_seq += 1
+                self.counters[STAT_CAPTURED] += 1
+                self.counters[STAT_BACKLOG] = min(self.latest_seq - self.consumed_seq, len(self.ring))
+            self.write_slot = (slot + 1) % len(self.ring)
+
+            # Only wake the scheduler for frames it will actually run
+            if self.wants_inference(captured_at):
+                with self.frame_ready:
+                    self.frame_ready.notify()
+
+    def has_new_frame(self):
+        return self.latest_seq > self.consumed_seq
+
+    def health(self):
+        return int(self.counters[STAT_HEALTH])
+
+    # Inference is due after motion, or once the keepalive interval has passed on a static scene
+    def wants_inference(self, now):
+        return self.motion_pending or now - self.last_inference >= self.keepalive
+
+    def ready_for_inference(self, now):
+        return self.has_new_frame() and self.wants_inference(now)
+
+    def latest_capture_time(self):
+        return self.capture_times[self.latest_slot]
+
+    # Copy the newest frame into out and return its capture time, or None if it was already consumed
+    def read_latest(self, out):
+        with self.lock:
+            if self.latest_seq == self.consumed_seq:
+                return None
+            np.copyto(out, self.ring[self.latest_slot])
+            self.consumed_seq = self.latest_seq
+            self.counters[STAT_BACKLOG] = 0
+            self.motion_pending = False
+            self.last_inference = time.monotonic()
+            return self.capture_times[self.latest_slot]
+
+    def mark_processed(self, captured_at):
+        self.counters[STAT_PROCESSED] += 1
+        self.counters[STAT_FRAME_AGE] = time.monotonic() - captured_at
+
+# Function to open a stream with FFmpeg timeouts, so a dead camera cannot block a read forever
+def open_capture(stream_url):
+    if hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC'):  # OpenCV 4.6+
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(OPEN_TIMEOUT * 1000),
+                  cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(READ_TIMEOUT * 1000)]
+        return cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG, params)
+    return cv2.VideoCapture(stream_url, cv2.CAP_FFMPEG)
+
+# Function to compute the backoff before the next reconnect attempt
+def reconnect_delay(failures):
+    delay = min(RECONNECT_MAX_DELAY, RECONNECT_MIN_DELAY * 2 ** (failures - 1))
+    return delay * random.uniform(0.5, 1.0)  # Jitter keeps many cameras from reconnecting in lockstep
+
+# Watches the grabbers of a pipeline and reports streams that stop delivering frames
+class StreamSupervisor(Thread):
+    def __init__(self, grabbers, stall_timeout=STALL_TIMEOUT, interval=SUPERVISOR_INTERVAL):
+        super().__init__(daemon=True)
+        self.grabbers = grabbers
+        self.stall_timeout = stall_timeout
+        self.interval = interval
+
+    def run(self):
+        reported = {grabber.idx: None for grabber in self.grabbers}
+        while True:
+            now = time.monotonic()
+            for grabber in self.grabbers:
+                # Reads time out on their own; this catches streams that are open but no longer decoding
+                if grabber.health() == HEALTH_LIVE and now - grabber.last_frame > self.stall_timeout:
+                    grabber.counters[STAT_HEALTH] = HEALTH_STALLED
+
+                health = grabber.health()
+                if health != reported[grabber.idx]:
+                    print(f"Stream {grabber.stream_url} is {HEALTH_STATES[health]}")
+                    reported[grabber.idx] = health
+            time.sleep(self.interval)
+
+# Central scheduler that runs the latest frame of every stream through the model as one batch
+class InferenceScheduler:
+    def __init__(self, model, mosaic, timings, grabbers, frame_ready, render=True, detection_queue=None,
+                 max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_BATCH_WAIT):
+        self.network = model.model  # The backend under AutoShape; batching and NMS are done here instead
+        self.names = model.names
+        self.conf_threshold = model.conf
+        self.mosaic = mosaic  # Annotated output, one tile per stream
+        self.timings = timings
+        self.render = render
+        self.detection_queue = detection_queue  # Receives one compact record per processed frame
+        self.grabbers = grabbers
+        self.frame_ready = frame_ready
+        self.batch_target = max(1, min(max_batch_size, len(grabbers)))
+        self.max_wait = max_wait
+        self.keepalive_poll = min(g.keepalive for g in grabbers) / 4 if grabbers else 1.0
+        self.batch_frames = np.zeros((self.batch_target, FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+        self.preprocessor = BatchPreprocessor(self.batch_target, model_input_size(self.network),
+                                              torch.device(getattr(self.network, 'device', 'cpu')),
+                                              getattr(self.network, 'fp16', False))
+        self.detections = {}  # Stream index -> latest detections (x1, y1, x2, y2, conf, cls)
+
+    def ready_grabbers(self):
+        now = time.monotonic()
+        return [g for g in self.grabbers if g.ready_for_inference(now)]
+
+    # Wait for a full batch or until the deadline passes, whichever comes first
+    def next_batch(self):
+        with self.frame_ready:
+            while not self.ready_grabbers():
+                # Time out so keepalive inferences still happen on streams without motion
+                self.frame_ready.wait(self.keepalive_poll)
+
+            deadline = time.monotonic() + self.max_wait
+            while len(self.ready_grabbers()) < self.batch_target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.frame_ready.wait(remaining)
+
+        # Streams whose newest frame has waited longest go first
+        ready = sorted(self.ready_grabbers(), key=lambda g: g.latest_capture_time())
+        batch = []
+        for grabber in ready[:self.batch_target]:
+            captured_at = grabber.read_latest(self.batch_frames[len(batch)])
+            if captured_at is not None:
+                batch.append((grabber, captured_at))
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.next_batch()
+            if not batch:
+                continue
+
+            # Run YOLOv5 inference on all frames in a single forward pass
+            started = time.perf_counter()
+            with torch.inference_mode():
+                predictions = self.network(self.preprocessor(self.batch_frames, len(batch)))
+                if isinstance(predictions, (list, tuple)):
+                    predictions = predictions[0]
+                predictions = [self.preprocessor.scale_boxes(detections).cpu().numpy()
+                               for detections in non_max_suppression(predictions, self.conf_threshold)]
+            inference_time = time.perf_counter() - started
+
+            # Route annotated frames and detections back to their streams
+            for i, (grabber, captured_at) in enumerate(batch):
+                detections = predictions[i]
+                self.detections[grabber.idx] = detections
+                self.timings.record(grabber.idx, STAGE_INFERENCE, inference_time)
+
+                # Drawing boxes is expensive, so it only happens when someone looks at the frames
+                if self.render:
+                    started = time.perf_counter()
+                    draw_detections(self.batch_frames[i], detections, self.names)
+                    self.mosaic.write(grabber.idx, self.batch_frames[i])
+                    self.timings.record(grabber.idx, STAGE_RENDER, time.perf_counter() - started)
+                if self.detection_queue is not None:
+                    self.detection_queue.put(self.detection_record(grabber.idx, captured_at, detections))
+                grabber.mark_processed(captured_at)
+
+    # Build a compact, JSON-ready record of one frame's detections
+    def detection_record(self, idx, captured_at, detections):
+        captured_wall_time = time.time() - (time.monotonic() - float(captured_at))
+        return {
+            'stream': idx,
+            'ts': round(captured_wall_time, 3),
+            'detections': [
+                {
+                    'cls': self.names[int(cls)],
+                    'box': [int(x1), int(y1), int(x2), int(y2)],
+                    'conf': round(float(conf), 3),
+                }
+                for x1, y1, x2, y2, conf, cls in detections
+            ],
+        }
+
+# Function to start grabbers and a scheduler for a subset of the streams
+def start_pipeline(model, stream_indices, mosaic, stats, timings, render=True, detection_queue=None,
+                   motion_gating=True, keepalive=KEEPALIVE_INTERVAL, preprocess='cpu'):
+    frame_ready = Condition()
+    grabbers = [
+        FrameGrabber(idx, streams[idx], frame_ready, stats[idx], timings, FrameResizer(preprocess),
+                     MotionGate() if motion_gating else None, keepalive)
+        for idx in stream_indices
+    ]
+    for grabber in grabbers:
+        grabber.start()
+    StreamSupervisor(grabbers).start()
+
+    scheduler = InferenceScheduler(model, mosaic, timings, grabbers, frame_ready, render, detection_queue)
+    scheduler_thread = Thread(target=scheduler.run, daemon=True)
+    scheduler_thread.start()
+    return scheduler_thread
+
+# Entry point of a detection worker process; frames and statistics are exchanged through shared memory
+def detection_worker(stream_indices, mosaic_name, stats_name, timings_names, torch_threads, model_options, options):
+    torch.set_num_threads(torch_threads)
+    mosaic = SharedMosaic(len(streams), mosaic_name)
+    stats_shm, stats = shared_array((len(streams), NUM_STATS), np.float64, stats_name)
+    timings = StageTimings(len(streams), timings_names)
+
+    # Each worker owns its model instance, so no interpreter lock is shared with other workers
+    model = load_model(warmup_batch=min(MAX_BATCH_SIZE, len(stream_indices)), **model_options)
+    start_pipeline(model, stream_indices, mosaic, stats, timings, **options).join()
+
+# Aggregates counters and latency histograms into a periodic log line and a Prometheus text page
+class MetricsReporter(Thread):
+    def __init__(self, stats, timings, detection_queue=None, interval=STATS_INTERVAL):
+        super().__init__(daemon=True)
+        self.stats = stats
+        self.timings = timings
+        self.detection_queue = detection_queue
+        self.interval = interval
+        self.capture_fps = np.zeros(len(streams))
+        self.inference_fps = np.zeros(len(streams))
+        # Without the reporter thread (--stats-interval 0) each scrape measures the rates since the previous one
+        self.scrape_lock = Lock()
+        self.last_scrape = (time.monotonic(), stats.copy())
+
+    # Captured and inferred frames per second between two snapshots of the stats
+    @staticmethod
+    def rates(stats, last_stats, elapsed):
+        return ((stats[:, STAT_CAPTURED] - last_stats[:, STAT_CAPTURED]) / elapsed,
+                (stats[:, STAT_PROCESSED] - last_stats[:, STAT_PROCESSED]) / elapsed)
+
+    def run(self):
+        last_time = time.monotonic()
+        last_stats = self.stats.copy()
+        last_counts = self.timings.counts.copy()
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            stats = self.stats.copy()
+            counts = self.timings.counts.copy()
+
+            self.capture_fps, self.inference_fps = self.rates(stats, last_stats, now - last_time)
+            print(self.summary(stats, counts - last_counts))
+            last_time, last_stats, last_counts = now, stats, counts
+
+    # One line covering all streams: health, throughput and stage latency percentiles for the last interval
+    def summary(self, stats, counts):
+        live = int(np.count_nonzero(stats[:, STAT_HEALTH] == HEALTH_LIVE))
+        parts = [f"{live}/{len(streams)} live",
+                 f"capture {self.capture_fps.sum():.1f} fps",
+                 f"inference {self.inference_fps.sum():.1f} fps"]
+        for stage, name in enumerate(STAGE_NAMES):
+            stage_counts = counts[:, stage].sum(axis=0)
+            if stage_counts.sum():
+                p50, p95, p99 = (histogram_quantile(stage_counts, q) * 1000 for q in (0.5, 0.95, 0.99))
+                parts.append(f"{name} p50/p95/p99 {p50:.1f}/{p95:.1f}/{p99:.1f}ms")
+        parts.append(f"dropped {stats[:, STAT_DROPPED].sum():.0f} skipped {stats[:, STAT_SKIPPED].sum():.0f}")
+        return "[stats] " + " | ".join(parts)
+
+    def detection_queue_depth(self):
+        try:
+            return self.detection_queue.qsize()
+        except (AttributeError, NotImplementedError):  # No queue, or multiprocessing queues on macOS
+            return 0
+
+    # Render everything in the Prometheus text exposition format
+    def prometheus_text(self):
+        stats = self.stats.copy()
+        counts = self.timings.counts.copy()
+        sums = self.timings.sums.copy()
+        if not self.is_alive():
+            with self.scrape_lock:
+                now = time.monotonic()
+                last_time, last_stats = self.last_scrape
+                if now > last_time:
+                    self.capture_fps, self.inference_fps = self.rates(stats, last_stats, now - last_time)
+                    self.last_scrape = (now, stats)
+        bounds = [f"{bound:.6g}" for bound in LATENCY_BUCKETS] + ["+Inf"]
+        lines = [
+            "# HELP yolo_stage_seconds Latency of each pipeline stage per stream.",
+            "# TYPE yolo_stage_seconds histogram",
+        ]
+        for idx in range(len(streams)):
+            for stage, name in enumerate(STAGE_NAMES):
+                labels = f'stream="{idx}",stage="{name}"'
+                cumulative = np.cumsum(counts[idx, stage])
+                for bound, count in zip(bounds, cumulative):
+                    lines.append(f'yolo_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f"yolo_stage_seconds_sum{{{labels}}} {sums[idx, stage]:.6f}")
+                lines.append(f"yolo_stage_seconds_count{{{labels}}} {cumulative[-1]}")
+
+        lines += ["# HELP yolo_frames_total Frames by outcome per stream.", "# TYPE yolo_frames_total counter"]
+        for idx in range(len(streams)):
+            for outcome, column in (("captured", STAT_CAPTURED), ("dropped", STAT_DROPPED),
+                                    ("skipped", STAT_SKIPPED), ("processed", STAT_PROCESSED)):
+                lines.append(f'yolo_frames_total{{stream="{idx}",outcome="{outcome}"}} {stats[idx, column]:.0f}')
+
+        gauges = (
+            ("yolo_capture_fps", "Decoded frames per second over the last interval or since the previous scrape.", self.capture_fps),
+            ("yolo_inference_fps", "Inferred frames per second over the last interval or since the previous scrape.", self.inference_fps),
+            ("yolo_frame_age_seconds", "Capture-to-detection age of the last processed frame.", stats[:, STAT_FRAME_AGE]),
+            ("yolo_frame_backlog", "Frames decoded since inference last took one.", stats[:, STAT_BACKLOG]),
+            ("yolo_stream_up", "1 while the stream is delivering frames.", stats[:, STAT_HEALTH] == HEALTH_LIVE),
+            ("yolo_stream_reconnects_total", "Reconnect attempts per stream.", stats[:, STAT_RECONNECTS]),
+        )
+        for metric, help_text, values in gauges:
+            metric_type = "counter" if metric.endswith("_total") else "gauge"
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {metric_type}"]
+            lines += [f'{metric}{{stream="{idx}"}} {float(value):g}' for idx, value in enumerate(values)]
+
+        lines += ["# HELP yolo_detection_queue_depth Detection records waiting to be published.",
+                  "# TYPE yolo_detection_queue_depth gauge",
+                  f"yolo_detection_queue_depth {self.detection_queue_depth()}"]
+        return "\n".join(lines) + "\n"
+
+# Function to serve /metrics from a background thread when there is no headless API
+def serve_metrics(port, reporter):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = reporter.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes every few seconds would flood the console
+
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://0.0.0.0:{port}/metrics")
+
+# Serves detections over HTTP/WebSocket from an asyncio loop and optionally forwards them to MQTT
+class DetectionPublisher(Thread):
+    def __init__(self, host, port, stats, reporter, mosaic=None, mqtt_host=None, mqtt_port=MQTT_PORT):
+        super().__init__(daemon=True)
+        from aiohttp import web  # Only needed in headless mode
+
+        self.web = web
+        self.host = host
+        self.port = port
+        self.stats = stats  # Per-stream counters and health shared with the pipelines
+        self.reporter = reporter
+        self.mosaic = mosaic  # Only set when frames are rendered
+        self.latest = {}  # Stream index -> most recent detection record
+        self.clients = set()  # One bounded queue per WebSocket client
+        self.loop = None
+        self.ready = Event()
+        self.mqtt = None
+        if mqtt_host:
+            self.mqtt = connect_mqtt(mqtt_host, mqtt_port)
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        web = self.web
+        self.loop = asyncio.get_running_loop()
+        app = web.Application()
+        app.router.add_get('/detections', self.handle_latest)
+        app.router.add_get('/ws', self.handle_websocket)
+        app.router.add_get('/health', self.handle_health)
+        app.router.add_get('/metrics', self.handle_metrics)
+        if self.mosaic is not None:
+            app.router.add_get('/streams/{idx}/snapshot.jpg', self.handle_snapshot)
+
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, self.host, self.port).start()
+        print(f"Serving detections on http://{self.host}:{self.port}/detections and ws://{self.host}:{self.port}/ws")
+        self.ready.set()
+        await asyncio.Event().wait()
+
+    # Called from the main thread for every record coming out of the schedulers
+    def publish(self, record):
+        if self.mqtt is not None:
+            self.mqtt.publish(MQTT_TOPIC.format(stream=record['stream']), json.dumps(record))
+        self.loop.call_soon_threadsafe(self.broadcast, record)
+
+    def broadcast(self, record):
+        self.latest[record['stream']] = record
+        for client in self.clients:
+            try:
+                client.put_nowait(record)
+            except asyncio.QueueFull:
+                pass  # Slow clients miss records instead of stalling everyone else
+
+    async def handle_latest(self, request):
+        return self.web.json_response([self.latest[idx] for idx in sorted(self.latest)])
+
+    async def handle_health(self, request):
+        return self.web.json_response([stream_status(idx, self.stats[idx]) for idx in range(len(streams))])
+
+    async def handle_metrics(self, request):
+        return self.web.Response(text=self.reporter.prometheus_text(), content_type='text/plain')
+
+    async def handle_websocket(self, request):
+        ws = self.web.WebSocketResponse()
+        await ws.prepare(request)
+        client = asyncio.Queue(maxsize=256)
+        self.clients.add(client)
+        try:
+            while not ws.closed:
+                await ws.send_json(await client.get())
+        except ConnectionResetError:
+            pass
+        finally:
+            self.clients.discard(client)
+        return ws
+
+    async def handle_snapshot(self, request):
+        idx = int(request.match_info['idx'])
+        if not 0 <= idx < self.mosaic.num_streams:
+            raise self.web.HTTPNotFound()
+        jpeg = await self.loop.run_in_executor(None, self.encode_snapshot, idx)
+        return self.web.Response(body=jpeg, content_type='image/jpeg')
+
+    def encode_snapshot(self, idx):
+        tile = np.empty((FRAME_HEIGHT, FRAME_WIDTH, 3), dtype=np.uint8)
+        self.mosaic.read(idx, tile)
+        return cv2.imencode('.jpg', tile)[1].tobytes()
+
+# Function to describe one stream's health and counters
+def stream_status(idx, row):
+    return {
+        'stream': idx,
+        'url': streams[idx],
+        'health': HEALTH_STATES[int(row[STAT_HEALTH])],
+        'reconnects': int(row[STAT_RECONNECTS]),
+        'captured': int(row[STAT_CAPTURED]),
+        'dropped': int(row[STAT_DROPPED]),
+        'skipped': int(row[STAT_SKIPPED]),
+        'processed': int(row[STAT_PROCESSED]),
+        'frame_age': round(float(row[STAT_FRAME_AGE]), 3),
+    }
+
+# Function to connect to an MQTT broker in the background
+def connect_mqtt(host, port):
+    import paho.mqtt.client as mqtt
+
+    if hasattr(mqtt, 'CallbackAPIVersion'):  # paho-mqtt 2.x
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
+    else:
+        client = mqtt.Client()
+    client.connect_async(host, port)
+    client.loop_start()
+    return client
+
+# Function to run without a window, publishing detections until interrupted
+def run_headless(publisher, detection_queue):
+    publisher.start()
+    publisher.ready.wait()
+    while True:
+        publisher.publish(detection_queue.get())
+
+# Function to display the annotated streams in a grid
+def display_grid(mosaic, timings):
+    # The display grid is allocated once; only tiles whose version changed are copied into it
+    grid_frame = np.zeros(mosaic.shape, dtype=np.uint8)
+    grid_tiles = [tile_view(grid_frame, idx) for idx in range(mosaic.num_streams)]
+    shown_versions = [0] * mosaic.num_streams
 
-    # Initialize CUDA objects
-    cuda_frame = cv2.cuda_GpuMat()
     while True:
-        ret, frame = cap.read()
-        if not ret:
-            frames_dict[idx] = np.zeros((480, 640, 3), dtype=np.uint8)
-            continue
+        for idx in range(mosaic.num_streams):
+            if mosaic.versions[idx] != shown_versions[idx]:
+                started = time.perf_counter()
+                version = mosaic.read(idx, grid_tiles[idx])
+                if version is not None:
+                    shown_versions[idx] = version
+                    timings.record(idx, STAGE_COMPOSE, time.perf_counter() - started)
+
+        # Display the grid
+        cv2.imshow(window_name, grid_frame)
+
+        # Exit on 'q' key
+        if cv2.waitKey(1) & 0xFF == ord('q'):
+            break
+
+    cv2.destroyAllWindows()
+
+def main():
+    parser = argparse.ArgumentParser(description="YOLOv5 detection on multiple RTSP streams")
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help="Number of detection worker processes (0 = threads in a single process)")
+    parser.add_argument('--weights', default=WEIGHTS,
+                        help="Local YOLOv5 weights; the hub's yolov5s is used if the file does not exist")
+    parser.add_argument('--yolov5-repo', help="Local YOLOv5 checkout to load the model code from")
+    parser.add_argument('--model-cache', default=MODEL_CACHE_DIR,
+                        help="Directory for TorchScript exports of local weights")
+    parser.add_argument('--warmup', type=int, default=WARMUP_RUNS,
+                        help="Number of warm-up batches to run before the streams start")
+    parser.add_argument('--preprocess', choices=['auto', 'cpu', 'cuda'], default=PREPROCESS_BACKEND,
+                        help="Backend used to resize decoded frames")
+    parser.add_argument('--benchmark-preprocess', action='store_true',
+                        help="Time the available preprocessing backends on this host and exit")
+    parser.add_argument('--headless', action='store_true',
+                        help="Run without a window and publish detections over HTTP/WebSocket")
+    parser.add_argument('--render', action='store_true',
+                        help="Draw detections in headless mode and serve /streams/<idx>/snapshot.jpg")
+    parser.add_argument('--host', default=API_HOST, help="Address of the headless results API")
+    parser.add_argument('--port', type=int, default=API_PORT, help="Port of the headless results API")
+    parser.add_argument('--no-motion-gate', action='store_true',
+                        help="Run inference on every frame instead of only on motion")
+    parser.add_argument('--keepalive', type=float, default=KEEPALIVE_INTERVAL,
+                        help="Seconds between inferences on a stream without motion")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help="Seconds between summary log lines (0 disables them)")
+    parser.add_argument('--metrics-port', type=int, default=METRICS_PORT,
+                        help="Serve Prometheus metrics on this port in desktop mode (headless mode uses /metrics)")
+    parser.add_argument('--mqtt', action='store_true', help="Also publish detections to an MQTT broker")
+    parser.add_argument('--mqtt-host', default=MQTT_HOST)
+    parser.add_argument('--mqtt-port', type=int, default=MQTT_PORT)
+    args = parser.parse_args()
+
+    if args.benchmark_preprocess:
+        benchmark_preprocessing(min(MAX_BATCH_SIZE, len(streams)))
+        return
+
+    # CPU-only OpenCV builds have no cv2.cuda kernels, so pick the resize backend up front
+    preprocess = args.preprocess
+    if preprocess == 'auto':
+        preprocess = 'cuda' if cuda_resize_available() else 'cpu'
+    elif preprocess == 'cuda' and not cuda_resize_available():
+        parser.error("this OpenCV build has no usable CUDA device; use --preprocess cpu")
 
-        # Upload frame to GPU
-        cuda_frame.upload(frame)
+    # The desktop grid always needs rendered frames
+    render = args.render or not args.headless
 
-        # Resize frame on GPU
-        resized_cuda_frame = cv2.cuda.resize(cuda_frame, (640, 480))
+    if len(streams) > rows * cols:
+        parser.error(f"{len(streams)} streams do not fit in a {rows}x{cols} grid")
 
-        # Download resized frame back to CPU
-        frame_resized = resized_cuda_frame.download()
+    # Annotated frames and counters live in shared memory so worker processes can write them in place
+    mosaic = SharedMosaic(len(streams))
+    stats_shm, stats = shared_array((len(streams), NUM_STATS), np.float64)
+    stats[:] = 0
+    timings = StageTimings(len(streams))
 
-        # Run YOLOv5 inference
-        results = model(frame_resized)
+    # Export local weights once here so workers only ever load the cached model
+    repo, source = resolve_yolov5_repo(args.yolov5_repo)
+    device = inference_device()
+    model_path = prepare_weights(args.weights, repo, source, args.model_cache, device=device)
+    model_options = {'model_path': model_path, 'repo': repo, 'source': source, 'device': str(device),
+                     'warmup_runs': args.warmup}
 
-        # Annotate frame with detection results
-        annotated_frame = np.squeeze(results.render())
-        frames_dict[idx] = annotated_frame
+    workers = []
+    ctx = mp.get_context('spawn')
+    publisher = None
+    detection_queue = None
+    if args.headless:
+        detection_queue = ctx.Queue() if args.workers > 0 else queue.Queue()
 
-# Initialize frame storage
-frames = {i: np.zeros((480, 640, 3), dtype=np.uint8) for i in range(len(streams))}
+    reporter = MetricsReporter(stats, timings, detection_queue, args.stats_interval)
+    if args.stats_interval > 0:
+        reporter.start()
+    if args.headless:
+        publisher = DetectionPublisher(args.host, args.port, stats, reporter, mosaic if render else None,
+                                       args.mqtt_host if args.mqtt else None, args.mqtt_port)
+    elif args.metrics_port:
+        serve_metrics(args.metrics_port, reporter)
 
-# Start threads to fetch and process frames
-threads = []
-for idx, stream in enumerate(streams):
-    thread = Thread(target=fetch_and_detect, args=(stream, frames, idx))
-    thread.daemon = True
-    threads.append(thread)
-    thread.start()
+    options = {
+        'render': render,
+        'detection_queue': detection_queue,
+        'motion_gating': not args.no_motion_gate,
+        'keepalive': args.keepalive,
+        'preprocess': preprocess,
+    }
 
-# Display the streams in a grid
-while True:
-    # Create a blank image for the grid
-    h, w = 480, 640  # Resize each stream to 640x480
-    grid_frame = np.zeros((rows * h, cols * w, 3), dtype=np.uint8)
+    if args.workers > 0:
+        # Shard the streams across worker processes
+        num_workers = min(args.workers, len(streams))
+        torch_threads = max(1, (os.cpu_count() or 1) // num_workers)
+        for worker_id in range(num_workers):
+            shard = list(range(worker_id, len(streams), num_workers))
+            worker = ctx.Process(target=detection_worker, daemon=True,
+                                 args=(shard, mosaic.name, stats_shm.name, timings.names, torch_threads,
+                                       model_options, options))
+            worker.start()
+            workers.append(worker)
+    else:
+        model = load_model(warmup_batch=min(MAX_BATCH_SIZE, len(streams)), **model_options)
+        start_pipeline(model, range(len(streams)), mosaic, stats, timings, **options)
 
-    for idx, frame in frames.items():
-        r, c = divmod(idx, cols)  # Get row and column in the grid
-        grid_frame[r * h:(r + 1) * h, c * w:(c + 1) * w] = frame
+    try:
+        if publisher is not None:
+            try:
+                run_headless(publisher, detection_queue)
+            except KeyboardInterrupt:
+                pass
+        else:
+            display_grid(mosaic, timings)
 
-    # Display the grid
-    cv2.imshow(window_name, grid_frame)
+        # Print per-stream capture statistics
+        for idx in range(len(streams)):
+            status = stream_status(idx, stats[idx])
+            print(f"{status['url']}: {status['health']} reconnects={status['reconnects']} "
+                  f"captured={status['captured']} dropped={status['dropped']} skipped={status['skipped']} "
+                  f"processed={status['processed']} frame_age={status['frame_age'] * 1000:.0f}ms")
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
 
-    # Exit on 'q' key
-    if cv2.waitKey(1) & 0xFF == ord('q'):
-        break
+        # In threaded mode the pipeline threads still hold views, so the mappings are left to process exit
+        if workers:
+            stats = None
+            stats_shm.close()
+            mosaic.close()
+            timings.close()
+        stats_shm.unlink()
+        mosaic.unlink()
+        timings.unlink()
 
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+import time
+import asyncio
+import logging
+import argparse
+import importlib.util
+from urllib.parse import urlsplit
+from scraper_fetch import AsyncFetcher, REQUESTS_PER_SECOND, MAX_RETRIES
+from scraper_cache import ResponseCache, CACHE_FILE
+from scraper_index import ProductIndex, INDEX_FILE, write_changes
+from scraper_export import StreamingExporter, EXPORT_FORMATS, BATCH_SIZE, convert_to_excel
+from scraper_extract import FIELDS
+from scraper_images import localize_images, IMAGE_PATH_FIELD
+
+# Batch defaults
+GLOBAL_CONCURRENCY = 32  # Requests in flight across every site
+PER_DOMAIN = 2  # Requests in flight to any one site
+
+# Outcome of crawling one seed
+class SiteResult:
+    def __init__(self, url):
+        self.url = url
+        self.domain = url.split("//")[-1].split("/")[0]  # Same folder name Web-Scrap.py uses
+        self.pages = 0
+        self.products = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.status = 'pending'
+
+# Function to load Web-Scrap.py, whose hyphenated name cannot be imported directly
+def load_web_scrap():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Web-Scrap.py')
+    spec = importlib.util.spec_from_file_location('web_scrap', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+# Function to read seed URLs, one per line; blank lines and # comments are skipped
+def read_seeds(path):
+    seeds = []
+    seen_domains = set()
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            url = line.split('#', 1)[0].strip()
+            if not url:
+                continue
+            if '//' not in url:
+                url = 'https://' + url
+            domain = url.split("//")[-1].split("/")[0]
+            # Each site's outputs live in one folder per domain, so a domain can only be crawled once per batch
+            if domain in seen_domains:
+                print(f"Skipping {url}: {domain} is already in the batch")
+                continue
+            seen_domains.add(domain)
+            seeds.append(url)
+    return seeds
+
+async def crawl_site(web_scrap, fetcher, cache, result, data_folder, fmt, excel, images=False, thumbnails=False):
+    started = time.perf_counter()
+    website_folder_path = os.path.join(data_folder, result.domain)
+    os.makedirs(website_folder_path, exist_ok=True)
+
+    exporter = StreamingExporter(website_folder_path, fmt=fmt, batch_size=BATCH_SIZE)
+    index = ProductIndex(os.path.join(website_folder_path, INDEX_FILE))
+    try:
+        changes = await web_scrap.crawl(result.url, exporter, cache, index, fetcher=fetcher, verbose=False)
+        write_changes(changes, website_folder_path)
+        result.status = 'done' if exporter.state['complete'] else 'incomplete'
+        fields = FIELDS
+        if images and exporter.state['complete']:
+            downloader = await localize_images(exporter.path, exporter.fmt, website_folder_path, thumbnails)
+            logging.info(f"{result.domain}: {downloader.summary()}")
+            fields = FIELDS + (IMAGE_PATH_FIELD,)
+        if excel and exporter.state['complete']:
+            await asyncio.to_thread(convert_to_excel, exporter.path, exporter.fmt,
+                                    os.path.join(website_folder_path, 'scraped_product_data.xlsx'), fields)
+    except Exception as e:
+        logging.exception(f"Crawl of {result.url} failed")
+        result.status = f"error: {e}"
+    finally:
+        exporter.flush()
+        index.close()
+        result.pages = len(exporter.done_pages)
+        result.products = exporter.rows_written
+        result.bytes = fetcher.bytes.get(urlsplit(result.url).netloc, 0)
+        result.seconds = time.perf_counter() - started
+    print(f"{result.domain}: {result.status}, {result.pages} pages, {result.products} products in {result.seconds:.1f}s")
+    return result
+
+# Function to crawl every seed at once; the shared fetcher enforces the global and per-domain limits
+async def crawl_all(seeds, data_folder, concurrency=GLOBAL_CONCURRENCY, per_domain=PER_DOMAIN,
+                    rate=REQUESTS_PER_SECOND, fmt='csv', excel=False, use_cache=True, web_scrap=None,
+                    images=False, thumbnails=False):
+    web_scrap = web_scrap or load_web_scrap()
+    results = [SiteResult(url) for url in seeds]
+    cache = ResponseCache(os.path.join(data_folder, CACHE_FILE)) if use_cache else None
+    try:
+        async with AsyncFetcher(concurrency=concurrency, rate=rate, max_retries=MAX_RETRIES,
+                                cache=cache, per_host=per_domain) as fetcher:
+            await asyncio.gather(*(crawl_site(web_scrap, fetcher, cache, result, data_folder, fmt, excel, images, thumbnails)
+                                   for result in results))
+    finally:
+        if cache is not None:
+            cache.close()
+    return results
+
+# Function to format a byte count for the summary table
+def format_bytes(count):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if count < 1024 or unit == 'GB':
+            return f"{count:.0f} {unit}" if unit == 'B' else f"{count:.1f} {unit}"
+        count /= 1024
+
+def print_summary(results, elapsed):
+    width = max([len('Site')] + [len(result.domain) for result in results])
+    print(f"\n{'Site':<{width}}  {'Pages':>6}  {'Products':>9}  {'Bytes':>10}  {'Time':>8}  Status")
+    for result in results:
+        print(f"{result.domain:<{width}}  {result.pages:>6}  {result.products:>9}  {format_bytes(result.bytes):>10}  "
+              f"{result.seconds:>7.1f}s  {result.status}")
+    print(f"{'Total':<{width}}  {sum(r.pages for r in results):>6}  {sum(r.products for r in results):>9}  "
+          f"{format_bytes(sum(r.bytes for r in results)):>10}  {elapsed:>7.1f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl every site in a seed file concurrently")
+    parser.add_argument('seeds', help="File with one site URL per line")
+    parser.add_argument('--concurrency', type=int, default=GLOBAL_CONCURRENCY, help="Requests in flight across all sites")
+    parser.add_argument('--per-domain', type=int, default=PER_DOMAIN, help="Requests in flight to one site")
+    parser.add_argument('--rate', type=float, default=REQUESTS_PER_SECOND, help="Requests per second to one site")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Export format per site")
+    parser.add_argument('--excel', action='store_true', help="Also convert each site's export to Excel")
+    parser.add_argument('--images', action='store_true', help="Download each site's product images")
+    parser.add_argument('--thumbnails', action='store_true', help="Also make image thumbnails")
+    parser.add_argument('--no-cache', action='store_true', help="Do not use or update the response cache")
+    parser.add_argument('--output', help="Folder holding the per-site folders (default: Website Data on the Desktop)")
+    args = parser.parse_args()
+
+    seeds = read_seeds(args.seeds)
+    if not seeds:
+        print("No sites in the seed file.")
+        return
+
+    web_scrap = load_web_scrap()
+    data_folder = args.output or os.path.join(web_scrap.get_desktop_path(), "Website Data")
+    os.makedirs(data_folder, exist_ok=True)
+
+    print(f"Crawling {len(seeds)} sites, {args.concurrency} requests at a time ({args.per_domain} per site)")
+    started = time.perf_counter()
+    results = asyncio.run(crawl_all(seeds, data_folder, args.concurrency, args.per_domain, args.rate,
+                                    args.format, args.excel, not args.no_cache, web_scrap,
+                                    args.images, args.thumbnails))
+    print_summary(results, time.perf_counter() - started)
+
+if __name__ == "__main__":
+    main()
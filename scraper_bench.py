@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import hashlib
+import tempfile
+import argparse
+import threading
+import importlib
+import subprocess
+from aiohttp import web
+from scraper_extract import EXTRACTOR, synthetic_listing
+from scraper_cache import ResponseCache, CACHE_FILE
+from scraper_batch import load_web_scrap
+from scraper_export import StreamingExporter
+
+# Benchmark defaults: a generated shop served on localhost, so runs need no network and are repeatable
+BENCH_PAGES = 50
+BENCH_PRODUCTS = 24  # Products per listing page
+BENCH_LATENCY = 0.05  # Seconds the server waits before answering each request
+BENCH_ERROR_RATE = 0.0  # Share of requests answered with a retryable 503
+BENCH_CONCURRENCY = 16
+BENCH_RATE = 1000.0  # Per-host request rate for Web-Scrap.py, high enough not to be the bottleneck
+BENCH_REPEAT = 1
+BENCH_TOLERANCE = 0.1  # Slowdown against a baseline that counts as a regression
+RECRAWL_TOLERANCE = 0.5  # Slowdown of a recrawl against its first crawl that counts as a regression
+SCRAPERS = ('web-scrap', 'scrapy')
+PAGINATION_STYLES = ('numbered', 'links')
+# Both scrapers run with their shipped settings. A fresh crawl starts with empty caches; a recrawl runs
+# after a warm-up crawl in the same folder, so every page comes back 304
+RUN_KINDS = ('fresh', 'recrawl')
+
+# Generated e-commerce site: numbered sites page with ?page=N, linked sites ignore ?page= and
+# only link to the next page through an opaque cursor. Pages carry an ETag and answer 304 when it matches
+class BenchShop:
+    def __init__(self, pages=BENCH_PAGES, products=BENCH_PRODUCTS, latency=BENCH_LATENCY,
+                 error_rate=BENCH_ERROR_RATE, pagination='numbered', seed=0):
+        self.pages = pages
+        self.products = products
+        self.latency = latency
+        self.error_rate = error_rate
+        self.pagination = pagination
+        self.random = random.Random(seed)
+        self.cursors = {hashlib.sha1(str(page).encode()).hexdigest()[:12]: page for page in range(2, pages + 1)}
+        self.cursor_of = {page: cursor for cursor, page in self.cursors.items()}
+        # Rows the shared extractor finds on a full page, which both scrapers should export for every page
+        self.page_rows = len(EXTRACTOR.extract(synthetic_listing(products), 'http://127.0.0.1/shop')[0])
+        self.loop = None
+        self.runner = None
+        self.url = None
+        self.reset()
+
+    # Counters for one benchmark run; pages counts listing pages served, repeats included
+    def reset(self):
+        self.stats = {'requests': 0, 'pages': 0, 'errors': 0, 'bytes': 0, 'not_modified': 0}
+
+    def next_link(self, page):
+        if page >= self.pages:
+            return None
+        return f"?page={page + 1}" if self.pagination == 'numbered' else f"?after={self.cursor_of[page + 1]}"
+
+    async def listing(self, request):
+        self.stats['requests'] += 1
+        await asyncio.sleep(self.latency)
+        if self.random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=503, headers={'Retry-After': '0'})
+
+        if 'after' in request.query:
+            page = self.cursors.get(request.query['after'], self.pages + 1)
+        elif self.pagination == 'numbered':
+            page = int(request.query.get('page', 1))
+        else:
+            page = 1
+        if page > self.pages:
+            # Past the last page the shop shows an empty listing
+            body = synthetic_listing(0, page, None)
+        else:
+            self.stats['pages'] += 1
+            body = synthetic_listing(self.products, page, self.next_link(page))
+        etag = '"' + hashlib.sha1(body.encode()).hexdigest()[:16] + '"'
+        if request.headers.get('If-None-Match') == etag:
+            self.stats['not_modified'] += 1
+            return web.Response(status=304, headers={'ETag': etag})
+        self.stats['bytes'] += len(body)
+        return web.Response(text=body, content_type='text/html', headers={'ETag': etag})
+
+    # Serve the shop from a background thread; returns the listing URL
+    def start(self):
+        started = threading.Event()
+        self.loop = asyncio.new_event_loop()
+
+        async def serve():
+            app = web.Application()
+            app.router.add_get('/shop', self.listing)
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            await web.TCPSite(self.runner, '127.0.0.1', 0).start()
+            port = self.runner.addresses[0][1]
+            self.url = f"http://127.0.0.1:{port}/shop"
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(serve())
+            started.set()
+            self.loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+# Function to crawl with Web-Scrap.py's asyncio scraper, with its response cache as main() uses it;
+# returns (products, complete)
+def crawl_web_scrap(web_scrap, url, workdir, concurrency, rate):
+    web_scrap.CONCURRENCY = concurrency
+    web_scrap.REQUESTS_PER_SECOND = rate
+    exporter = StreamingExporter(workdir, resume=False)
+    cache = ResponseCache(os.path.join(workdir, CACHE_FILE))
+    try:
+        asyncio.run(web_scrap.crawl(url, exporter, cache, verbose=False))
+    finally:
+        cache.close()
+    return exporter.rows_written, exporter.state['complete']
+
+# Function to crawl with scrapy_scraper.py's ProductSpider with run_scrapy's defaults, HTTP cache and
+# AutoThrottle included; returns (products, complete)
+def crawl_scrapy(scrapy_scraper, url, workdir, concurrency, rate):
+    # Only the crawl and its feed export are measured
+    scrapy_scraper.EXPORT_EXCEL = False
+    stats = scrapy_scraper.run_scrapy(url, concurrent_requests=concurrency, concurrent_requests_per_domain=concurrency,
+                                      resume=False)
+    return stats.get('item_scraped_count', 0), stats.get('finish_reason') == 'finished'
+
+# Each scraper's module loader and crawl function; loading happens before the clock starts
+RUNNERS = {
+    'web-scrap': (load_web_scrap, crawl_web_scrap),
+    'scrapy': (lambda: importlib.import_module('scrapy_scraper'), crawl_scrapy),
+}
+
+# Function to measure one crawl inside the benchmark's child process and print the result as JSON
+def child(scraper, url, workdir, concurrency, rate):
+    load, crawl = RUNNERS[scraper]
+    module = load()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    products, complete = crawl(module, url, workdir, concurrency, rate)
+    result = {
+        'seconds': time.perf_counter() - started,
+        'cpu_seconds': time.process_time() - cpu_started,
+        'products': products,
+        'complete': complete,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+    print(json.dumps(result))
+
+# Function to read the process's peak resident set size; resource is not available on Windows
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+# Function to run one scraper against the shop in a fresh process, so CPU time and memory are its own;
+# a recrawl is measured after an untimed warm-up crawl in the same folder has filled the caches
+def bench(shop, scraper, concurrency, rate, run='fresh'):
+    with tempfile.TemporaryDirectory(prefix='scraper-bench-') as workdir:
+        # The scrapers write under the home folder (Desktop, Documents), so give the child a throwaway one
+        env = dict(os.environ, HOME=workdir, USERPROFILE=workdir)
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), env.get('PYTHONPATH')]))
+        command = [sys.executable, os.path.abspath(__file__), '--child', scraper, shop.url, workdir,
+                   '--concurrency', str(concurrency), '--rate', str(rate)]
+        warmup = None
+        if run == 'recrawl':
+            shop.reset()
+            warmup = run_child(command, workdir, env, scraper)
+        shop.reset()
+        result = run_child(command, workdir, env, scraper)
+        # The warm-up is a first crawl with the same settings, which the recrawl should beat
+        result['warmup_seconds'] = warmup['seconds'] if warmup else None
+
+    result.update(scraper=scraper, pagination=shop.pagination, run=run, **shop.stats)
+    result['pages_per_second'] = shop.pages / result['seconds']
+    result['products_per_second'] = result['products'] / result['seconds']
+    # Every generated page should have been exported exactly once
+    result['complete'] = result['complete'] and result['products'] == shop.pages * shop.page_rows
+    return result
+
+def run_child(command, workdir, env, scraper):
+    process = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise RuntimeError(f"{scraper} benchmark failed:\n{process.stderr[-2000:]}")
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+def print_results(results, baseline=None):
+    print(f"\n{'Scraper':<10} {'Paging':<9} {'Run':<8} {'Time':>7} {'Pages/s':>8} {'Products/s':>11} {'CPU':>7} "
+          f"{'Peak RSS':>9} {'Requests':>9} {'304s':>6} {'Errors':>7}  Complete")
+    for result in results:
+        rss = f"{result['peak_rss_mb']:.0f} MB" if result['peak_rss_mb'] is not None else 'n/a'
+        line = (f"{result['scraper']:<10} {result['pagination']:<9} {result['run']:<8} {result['seconds']:>6.2f}s "
+                f"{result['pages_per_second']:>8.1f} {result['products_per_second']:>11.1f} "
+                f"{result['cpu_seconds']:>6.2f}s {rss:>9} {result['requests']:>9} {result['not_modified']:>6} {result['errors']:>7}  "
+                f"{'yes' if result['complete'] else 'NO'}")
+        previous = (baseline or {}).get(result_key(result))
+        if previous:
+            line += f"  ({result['pages_per_second'] / previous['pages_per_second'] - 1:+.0%} pages/s vs baseline)"
+        print(line)
+
+def result_key(result):
+    # Results saved before recrawls were measured are fresh crawls
+    return f"{result['scraper']}/{result['pagination']}/{result.get('run', 'fresh')}"
+
+# Function to list the results that are incomplete, slower than the baseline by more than the tolerance,
+# or recrawls slower than the warm-up crawl whose pages they revalidate
+def regressions(results, baseline=None, tolerance=BENCH_TOLERANCE):
+    found = []
+    for result in results:
+        if not result['complete']:
+            found.append(f"{result_key(result)} did not export every product")
+            continue
+        warmup = result.get('warmup_seconds')
+        if warmup and result['seconds'] > warmup * (1 + RECRAWL_TOLERANCE):
+            found.append(f"{result_key(result)}: {result['seconds']:.2f}s, slower than the first crawl's {warmup:.2f}s")
+        previous = (baseline or {}).get(result_key(result))
+        if previous and result['pages_per_second'] < previous['pages_per_second'] * (1 - tolerance):
+            found.append(f"{result_key(result)}: {result['pages_per_second']:.1f} pages/s, "
+                         f"baseline {previous['pages_per_second']:.1f}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against a generated shop served locally")
+    parser.add_argument('--scrapers', nargs='+', choices=SCRAPERS, default=list(SCRAPERS), help="Scrapers to run")
+    parser.add_argument('--pagination', nargs='+', choices=PAGINATION_STYLES, default=list(PAGINATION_STYLES),
+                        help="Pagination styles to generate")
+    parser.add_argument('--pages', type=int, default=BENCH_PAGES, help="Listing pages in the shop")
+    parser.add_argument('--products', type=int, default=BENCH_PRODUCTS, help="Products per page")
+    parser.add_argument('--latency', type=float, default=BENCH_LATENCY, help="Server latency per request in seconds")
+    parser.add_argument('--error-rate', type=float, default=BENCH_ERROR_RATE, help="Share of requests answered with 503")
+    parser.add_argument('--concurrency', type=int, default=BENCH_CONCURRENCY, help="Requests in flight")
+    parser.add_argument('--rate', type=float, default=BENCH_RATE, help="Requests per second for Web-Scrap.py")
+    parser.add_argument('--runs', nargs='+', choices=RUN_KINDS, default=list(RUN_KINDS),
+                        help="Crawl with empty caches, and again after a warm-up crawl")
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT, help="Runs per case; the fastest is kept")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the injected errors")
+    parser.add_argument('--output', help="Write the results as JSON, to use as a later baseline")
+    parser.add_argument('--baseline', help="Earlier --output file to compare against")
+    parser.add_argument('--tolerance', type=float, default=BENCH_TOLERANCE, help="Slowdown allowed against the baseline")
+    parser.add_argument('--child', nargs=3, metavar=('SCRAPER', 'URL', 'WORKDIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child, args.concurrency, args.rate)
+        return
+
+    print(f"{args.pages} pages x {args.products} products, {args.latency * 1000:.0f} ms latency, "
+          f"{args.error_rate:.0%} errors, {args.concurrency} requests in flight")
+    results = []
+    for pagination in args.pagination:
+        shop = BenchShop(args.pages, args.products, args.latency, args.error_rate, pagination, args.seed)
+        shop.start()
+        try:
+            for scraper in args.scrapers:
+                for run in args.runs:
+                    runs = [bench(shop, scraper, args.concurrency, args.rate, run) for _ in range(args.repeat)]
+                    result = min(runs, key=lambda result: result['seconds'])
+                    print(f"{scraper} ({pagination}, {run}): {result['seconds']:.2f}s")
+                    results.append(result)
+        finally:
+            shop.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = {result_key(result): result for result in json.load(f)}
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    # Exits with status 1 on a regression
+    found = regressions(results, baseline, args.tolerance)
+    for problem in found:
+        print(f"Regression: {problem}")
+    if found:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
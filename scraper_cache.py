@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import platform
+
+# Default cache settings
+CACHE_FILE = 'http-cache.sqlite'
+CACHE_MAX_BYTES = 512 * 1024 * 1024  # Compressed bodies kept on disk before the least recently used are evicted
+COMPRESSION_LEVEL = 6
+
+# Function to get the cache file shared by Web-Scrap.py and the Scrapy spider, kept in the "Website Data"
+# folder on the Desktop next to Web-Scrap.py's site folders
+def shared_cache_path():
+    if platform.system() == "Windows":
+        home = os.environ['USERPROFILE']
+    else:
+        home = os.path.expanduser("~")
+    return os.path.join(home, 'Desktop', 'Website Data', CACHE_FILE)
+
+# One cached response, with the validators needed for a conditional GET
+class CachedResponse:
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    # Header lookup ignoring case, as servers differ in how they spell e.g. ETag
+    def header(self, name):
+        name = name.lower()
+        for key, value in self.headers.items():
+            if key.lower() == name:
+                return value
+        return None
+
+    @property
+    def etag(self):
+        return self.header('ETag')
+
+    @property
+    def last_modified(self):
+        return self.header('Last-Modified')
+
+    # Request headers that ask the server to answer 304 if the page has not changed
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+# Persistent, size-bounded LRU cache of compressed responses keyed by URL, stored in SQLite
+class ResponseCache:
+    def __init__(self, path, max_bytes=CACHE_MAX_BYTES):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, status INTEGER, headers TEXT, body BLOB, "
+            "parsed TEXT, size INTEGER, stored REAL, used REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.revalidated = 0
+
+    def get(self, url):
+        row = self.db.execute("SELECT status, headers, body FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return None
+        self.db.execute("UPDATE responses SET used = ? WHERE url = ?", (time.time(), url))
+        self.db.commit()
+        self.hits += 1
+        return CachedResponse(url, row[0], json.loads(row[1]), zlib.decompress(row[2]))
+
+    # Store a response; any parse result cached for the previous body is dropped
+    def put(self, url, status, headers, body):
+        compressed = zlib.compress(body, COMPRESSION_LEVEL)
+        now = time.time()
+        self.forget(url, commit=False)
+        self.db.execute(
+            "INSERT INTO responses (url, status, headers, body, parsed, size, stored, used) VALUES (?, ?, ?, ?, NULL, ?, ?, ?)",
+            (url, status, json.dumps(dict(headers)), compressed, len(compressed), now, now),
+        )
+        self.total_bytes += len(compressed)
+        self.evict()
+        self.db.commit()
+
+    # Mark a cached response as confirmed unchanged by the server (304), optionally with refreshed headers
+    def touch(self, url, headers=None):
+        self.revalidated += 1
+        if headers is None:
+            self.db.execute("UPDATE responses SET used = ? WHERE url = ?", (time.time(), url))
+        else:
+            self.db.execute("UPDATE responses SET used = ?, headers = ? WHERE url = ?",
+                            (time.time(), json.dumps(dict(headers)), url))
+        self.db.commit()
+
+    # Parse results are kept next to the body so an unchanged page need not be parsed again
+    def get_parsed(self, url):
+        row = self.db.execute("SELECT parsed FROM responses WHERE url = ?", (url,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def put_parsed(self, url, value):
+        parsed = json.dumps(value)
+        row = self.db.execute("SELECT LENGTH(parsed) FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is None:
+            return
+        self.db.execute("UPDATE responses SET parsed = ?, size = size - ? + ? WHERE url = ?",
+                        (parsed, row[0] or 0, len(parsed), url))
+        self.total_bytes += len(parsed) - (row[0] or 0)
+        self.db.commit()
+
+    def forget(self, url, commit=True):
+        row = self.db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        if row is not None:
+            self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.total_bytes -= row[0]
+            if commit:
+                self.db.commit()
+
+    # Drop least recently used entries until the cache fits in max_bytes
+    def evict(self):
+        if self.total_bytes <= self.max_bytes:
+            return
+        evicted = 0
+        for url, size in self.db.execute("SELECT url, size FROM responses ORDER BY used").fetchall():
+            if self.total_bytes <= self.max_bytes:
+                break
+            self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self.total_bytes -= size
+            evicted += 1
+        logging.info(f"Evicted {evicted} cached responses from {self.path}")
+
+    def close(self):
+        self.db.close()
+
+# Scrapy HTTPCACHE_STORAGE backend on ResponseCache; with RESPONSE_CACHE_PATH set to shared_cache_path() the
+# spider and Web-Scrap.py share entries.
+# Enable with HTTPCACHE_ENABLED = True, HTTPCACHE_STORAGE = 'scraper_cache.ScrapyCacheStorage' and
+# HTTPCACHE_POLICY = 'scrapy.extensions.httpcache.RFC2616Policy' so stale pages are revalidated with ETag/Last-Modified.
+class ScrapyCacheStorage:
+    def __init__(self, settings):
+        self.path = settings.get('RESPONSE_CACHE_PATH') or os.path.join(settings.get('HTTPCACHE_DIR', 'httpcache'), CACHE_FILE)
+        self.max_bytes = settings.getint('RESPONSE_CACHE_MAX_BYTES', CACHE_MAX_BYTES)
+        self.cache = None
+
+    def open_spider(self, spider):
+        self.cache = ResponseCache(self.path, self.max_bytes)
+        # Lets the spider reuse parse results for responses served from the cache
+        spider.response_cache = self.cache
+
+    def close_spider(self, spider):
+        self.cache.close()
+
+    def retrieve_response(self, spider, request):
+        from scrapy.http import Headers
+        from scrapy.responsetypes import responsetypes
+
+        cached = self.cache.get(request.url)
+        if cached is None:
+            return None
+        headers = Headers(cached.headers)
+        respcls = responsetypes.from_args(headers=headers, url=cached.url, body=cached.body)
+        return respcls(url=cached.url, headers=headers, status=cached.status, body=cached.body)
+
+    def store_response(self, spider, request, response):
+        headers = {key.decode('latin-1'): response.headers.get(key).decode('latin-1') for key in response.headers}
+        # After a 304 Scrapy stores the cached copy again with freshened headers; keep its body and parse result
+        if 'cached' in response.flags:
+            self.cache.touch(request.url, headers)
+            return
+        self.cache.put(request.url, response.status, headers, response.body)
@@ -0,0 +1,172 @@
+import os
+import csv
+import json
+import glob
+import logging
+from scraper_extract import FIELDS
+
+# Default export settings
+EXPORT_NAME = 'scraped_product_data'
+EXPORT_FORMAT = 'csv'  # csv, jsonl or parquet
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+BATCH_SIZE = 500  # Rows buffered before they are written out and checkpointed
+
+# Streams product rows to CSV, JSON Lines or Parquet in batches, checkpointing after each batch so an
+# interrupted crawl resumes where the last batch ended instead of starting over
+class StreamingExporter:
+    def __init__(self, folder, fmt=EXPORT_FORMAT, basename=EXPORT_NAME, batch_size=BATCH_SIZE, fields=FIELDS, resume=True):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {fmt!r}, expected one of {', '.join(EXPORT_FORMATS)}")
+        self.folder = folder
+        self.fmt = fmt
+        self.fields = list(fields)
+        self.batch_size = batch_size
+        # Parquet files cannot be appended to, so every batch becomes one part file in a dataset folder
+        self.path = os.path.join(folder, f"{basename}.{fmt}")
+        self.checkpoint_path = os.path.join(folder, f"{basename}.checkpoint.json")
+        self.buffer = []
+        self.pending_pages = []
+        self.state = {'format': fmt, 'rows': 0, 'size': 0, 'parts': 0, 'pages': [], 'complete': False}
+
+        checkpoint = self.load_checkpoint() if resume else None
+        if checkpoint is not None:
+            self.state = checkpoint
+            self.discard_unchecked()
+            logging.info(f"Resuming export to {self.path}: {self.state['rows']} rows from {len(self.state['pages'])} pages already written")
+        else:
+            self.start()
+        self.done_pages = set(self.state['pages'])
+
+    @property
+    def resumed(self):
+        return bool(self.state['pages'])
+
+    @property
+    def rows_written(self):
+        return self.state['rows'] + len(self.buffer)
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('complete') or checkpoint.get('format') != self.fmt:
+            return None
+        return checkpoint
+
+    def save_checkpoint(self):
+        # Write then rename, so a crash never leaves a half-written checkpoint
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+
+    # Function to start a fresh export, replacing the output of an earlier run
+    def start(self):
+        if self.fmt == 'parquet':
+            os.makedirs(self.path, exist_ok=True)
+            for part in glob.glob(os.path.join(self.path, 'part-*.parquet')):
+                os.remove(part)
+        else:
+            with open(self.path, 'w', newline='', encoding='utf-8') as f:
+                if self.fmt == 'csv':
+                    csv.writer(f).writerow(self.fields)
+            self.state['size'] = os.path.getsize(self.path)
+        self.save_checkpoint()
+
+    # Drop anything written after the last checkpoint; those pages are scraped again
+    def discard_unchecked(self):
+        if self.fmt == 'parquet':
+            for part in glob.glob(os.path.join(self.path, 'part-*.parquet')):
+                if int(os.path.basename(part)[5:10]) >= self.state['parts']:
+                    os.remove(part)
+        else:
+            with open(self.path, 'r+b') as f:
+                f.truncate(self.state['size'])
+
+    # Queue a page's rows; returns False if the page was already exported by an interrupted run
+    def write_page(self, url, rows):
+        if url in self.done_pages:
+            return False
+        self.buffer.extend(rows)
+        self.pending_pages.append(url)
+        self.done_pages.add(url)
+        # Batches end on page boundaries so the checkpoint can list whole pages
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+        return True
+
+    def flush(self):
+        if not self.pending_pages:
+            return
+        if self.buffer:
+            if self.fmt == 'parquet':
+                self.write_parquet_part(self.buffer)
+            else:
+                self.append(self.buffer)
+        self.state['rows'] += len(self.buffer)
+        self.state['pages'].extend(self.pending_pages)
+        self.buffer = []
+        self.pending_pages = []
+        self.save_checkpoint()
+
+    def append(self, rows):
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            if self.fmt == 'csv':
+                csv.writer(f).writerows(rows)
+            else:
+                f.writelines(json.dumps(dict(zip(self.fields, row)), ensure_ascii=False) + '\n' for row in rows)
+            f.flush()
+            os.fsync(f.fileno())
+        self.state['size'] = os.path.getsize(self.path)
+
+    def write_parquet_part(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        columns = list(zip(*rows))
+        table = pa.table({field: list(column) for field, column in zip(self.fields, columns)})
+        pq.write_table(table, os.path.join(self.path, f"part-{self.state['parts']:05d}.parquet"))
+        self.state['parts'] += 1
+
+    # Write the last batch and mark the export complete, so the next run starts afresh
+    def close(self):
+        self.flush()
+        self.state['complete'] = True
+        self.save_checkpoint()
+        logging.info(f"Exported {self.state['rows']} rows to {self.path}")
+
+# Function to read exported rows back one at a time, whatever the format; a folder is read part by part
+def read_rows(path, fmt):
+    if os.path.isdir(path):
+        for part in sorted(glob.glob(os.path.join(path, f'*.{fmt}'))):
+            yield from read_rows(part, fmt)
+    elif fmt == 'csv':
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+    elif fmt == 'jsonl':
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                yield list(json.loads(line).values())
+    else:
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from zip(*(column.to_pylist() for column in batch.columns))
+
+# Function to convert an export to Excel, streaming rows through a write-only workbook
+def convert_to_excel(path, fmt, output_file, fields=FIELDS):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(list(fields))
+    for row in read_rows(path, fmt):
+        sheet.append(list(row))
+    workbook.save(output_file)
+    return output_file
+
@@ -0,0 +1,187 @@
+import re
+import time
+import argparse
+from urllib.parse import urljoin
+from lxml import etree
+import lxml.html
+
+# Column order shared by both scrapers' exports
+FIELDS = ('Product Name', 'Price', 'Description', 'Model Number', 'Image URLs')
+MISSING = 'N/A'
+
+# Elements whose class marks them as a product container
+CONTAINER_CLASS = r'(product|item)'
+# Link to the following page of a listing
+NEXT_CLASS = r'next'
+
+# Field rules: (field, tag pattern, class pattern, attribute to read or None for the element's text)
+PRODUCT_RULES = (
+    ('Product Name', r'h\d', r'(name|title)', None),
+    ('Price', r'span', r'(price|amount)', None),
+    ('Description', r'p', r'(description|detail)', None),
+    ('Model Number', r'span', r'(model|sku)', None),
+    ('Image URLs', r'img', r'(image|img|photo)', 'src'),
+)
+
+# Benchmark defaults
+BENCH_PRODUCTS = 200
+BENCH_REPEAT = 20
+
+# Field rule compiled once: the tag test becomes a set lookup when the pattern is a plain tag name
+class CompiledRule:
+    def __init__(self, index, field, tag, class_pattern, attribute):
+        self.index = index
+        self.field = field
+        self.tags = {tag} if tag.isalnum() else None
+        self.tag_pattern = re.compile(tag)
+        self.class_pattern = re.compile(class_pattern, re.IGNORECASE)
+        self.attribute = attribute
+
+    def matches(self, element):
+        if self.tags is not None:
+            if element.tag not in self.tags:
+                return False
+        elif not self.tag_pattern.search(element.tag):
+            return False
+        return self.class_pattern.search(element.get('class', '')) is not None
+
+# lxml-based product extractor: the rules are compiled once and every container is walked a single time
+class ProductExtractor:
+    def __init__(self, rules=PRODUCT_RULES, container_class=CONTAINER_CLASS, next_class=NEXT_CLASS):
+        self.rules = [CompiledRule(i, *rule) for i, rule in enumerate(rules)]
+        self.fields = tuple(rule.field for rule in self.rules)
+        self.container_pattern = re.compile(container_class, re.IGNORECASE)
+        self.next_pattern = re.compile(next_class, re.IGNORECASE)
+        # Only elements with a class attribute can match anything, so let libxml2 do that filtering
+        self.classed = etree.XPath('//*[@class]')
+        self.parser = lxml.html.HTMLParser(encoding='utf-8')
+
+    # Parse HTML (str or bytes) and return (rows, next_link)
+    def extract(self, html, base_url):
+        if isinstance(html, str):
+            html = html.encode('utf-8')
+        root = etree.fromstring(html, self.parser) if html.strip() else None
+        if root is None:
+            return [], None
+        return self.extract_tree(root, base_url)
+
+    # Extract from an already parsed lxml tree, e.g. a Scrapy response's selector root
+    def extract_tree(self, root, base_url):
+        rows = []
+        next_link = None
+        for element in self.classed(root):
+            class_name = element.get('class')
+            if self.container_pattern.search(class_name):
+                rows.append(self.extract_product(element, base_url))
+            if next_link is None and element.tag == 'a' and element.get('href') and self.next_pattern.search(class_name):
+                next_link = element.get('href')
+        return rows, next_link
+
+    # Fill every field in one pass over the container's descendants, stopping once all are found
+    def extract_product(self, container, base_url):
+        values = [None] * len(self.rules)
+        remaining = list(self.rules)
+        for element in container.iterdescendants(etree.Element):
+            if 'class' not in element.attrib:
+                continue
+            # One element can satisfy several rules, as with the per-field searches
+            for rule in tuple(remaining):
+                if rule.matches(element):
+                    values[rule.index] = self.value(rule, element, base_url)
+                    remaining.remove(rule)
+            if not remaining:
+                break
+        return tuple(MISSING if value is None else value for value in values)
+
+    def value(self, rule, element, base_url):
+        if rule.attribute is None:
+            return ''.join(element.itertext()).strip()
+        value = element.get(rule.attribute)
+        if rule.attribute == 'src':
+            # Inline base64 images are not worth keeping; relative paths are resolved against the page
+            if not value or value.startswith('data:image'):
+                return MISSING
+            if not value.startswith('http'):
+                value = urljoin(base_url, value)
+        return value if value else MISSING
+
+# Shared extractor used by Web-Scrap.py and scrapy_scraper.py
+EXTRACTOR = ProductExtractor()
+
+# Function to extract products with the original per-field BeautifulSoup searches, kept for comparison
+def legacy_extract(html, url):
+    from bs4 import BeautifulSoup
+
+    rows = []
+    soup = BeautifulSoup(html, 'html.parser')
+    for product in soup.find_all(True, {'class': re.compile(r'(product|item)', re.IGNORECASE)}):
+        name = product.find(re.compile(r'h\d'), class_=re.compile(r'(name|title)', re.IGNORECASE))
+        price = product.find('span', class_=re.compile(r'(price|amount)', re.IGNORECASE))
+        description = product.find('p', class_=re.compile(r'(description|detail)', re.IGNORECASE))
+        model = product.find('span', class_=re.compile(r'(model|sku)', re.IGNORECASE))
+        img = product.find('img', class_=re.compile(r'(image|img|photo)', re.IGNORECASE))
+        img_url = img.get('src') if img else MISSING
+        if img_url != MISSING and not img_url.startswith('data:image'):
+            if not img_url.startswith('http'):
+                img_url = urljoin(url, img_url)
+        else:
+            img_url = MISSING
+        rows.append(tuple(tag.text.strip() if tag else MISSING for tag in (name, price, description, model)) + (img_url,))
+    return rows
+
+# Function to build a listing page resembling a typical shop catalogue; product numbers continue across pages
+def synthetic_listing(products, page=1, next_link='?page=2'):
+    cards = []
+    for i in range((page - 1) * products, page * products):
+        cards.append(
+            f'<li class="grid-item product-card" data-id="{i}">'
+            f'<a href="/p/{i}"><img class="product-image lazy" src="/img/{i}.jpg" alt=""></a>'
+            f'<div class="card-body"><h3 class="product-title"><a href="/p/{i}">Product {i}</a></h3>'
+            f'<div class="rating"><span class="star"></span><span class="star"></span><span class="count">({i % 97})</span></div>'
+            f'<span class="price-current">${i % 500}.99</span> <span class="price-old">${i % 500 + 20}.99</span>'
+            f'<p class="short-description">Description of product {i} with <b>some</b> markup.</p>'
+            f'<span class="sku">SKU-{i:06d}</span></div></li>'
+        )
+    pagination = f'<a class="pagination-next" href="{next_link}">Next</a>' if next_link else ''
+    return ('<html><head><title>Shop</title></head><body><nav class="menu">'
+            + ''.join(f'<a class="menu-link" href="/c/{c}">Category {c}</a>' for c in range(30))
+            + '</nav><ul class="listing">' + ''.join(cards)
+            + '</ul>' + pagination + '</body></html>')
+
+def time_extract(function, pages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            function(html, 'http://shop.example/')
+    return (time.perf_counter() - started) / (repeat * len(pages))
+
+# Microbenchmark comparing the compiled extractor with the legacy BeautifulSoup path
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark product extraction on saved or synthetic listing pages")
+    parser.add_argument('files', nargs='*', help="Saved HTML pages (a synthetic listing is used if none are given)")
+    parser.add_argument('--products', type=int, default=BENCH_PRODUCTS, help="Products on the synthetic page")
+    parser.add_argument('--repeat', type=int, default=BENCH_REPEAT, help="Times each page is parsed")
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.files:
+        with open(path, 'rb') as f:
+            pages.append(f.read().decode('utf-8', errors='replace'))
+    if not pages:
+        pages.append(synthetic_listing(args.products))
+
+    for html in pages:
+        rows, _ = EXTRACTOR.extract(html, 'http://shop.example/')
+        if rows != legacy_extract(html, 'http://shop.example/'):
+            print("Warning: the extractors disagree on at least one page")
+            break
+
+    legacy = time_extract(legacy_extract, pages, args.repeat)
+    compiled = time_extract(lambda html, url: EXTRACTOR.extract(html, url), pages, args.repeat)
+    print(f"{len(pages)} page(s), {args.repeat} repeats")
+    print(f"BeautifulSoup (html.parser): {legacy * 1000:.2f} ms/page")
+    print(f"Compiled lxml extractor:     {compiled * 1000:.2f} ms/page")
+    print(f"Speedup: {legacy / compiled:.1f}x")
+
+if __name__ == "__main__":
+    main()
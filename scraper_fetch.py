@@ -0,0 +1,231 @@
+import re
+import time
+import random
+import asyncio
+import logging
+from urllib.parse import urlsplit, urlunsplit, urljoin, parse_qsl, urlencode
+import aiohttp
+
+# Default fetch settings
+CONCURRENCY = 8  # Requests in flight across all hosts
+REQUESTS_PER_SECOND = 2.0  # Sustained request rate per host
+BURST = 4  # Requests a host may receive back to back before the rate limit applies
+PER_HOST = None  # Requests in flight to a single host; None leaves only the overall limit
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0  # Seconds, doubled on every retry
+RETRY_MAX_DELAY = 30.0
+TIMEOUT = 30  # Seconds per request
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+PAGE_WINDOW = 8  # Numbered pages fetched ahead of the one being processed
+
+# Response body and metadata, read fully so the connection can go back to the pool
+class FetchResponse:
+    def __init__(self, url, status, headers, body, encoding=None, not_modified=False):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.encoding = encoding or 'utf-8'
+        # True when the body came from the response cache after the server answered 304
+        self.not_modified = not_modified
+
+    @property
+    def text(self):
+        try:
+            return self.body.decode(self.encoding, errors='replace')
+        except LookupError:
+            # Unknown charset name in the Content-Type header
+            return self.body.decode('utf-8', errors='replace')
+
+# Token bucket limiting the request rate to a single host
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# Pooled asyncio HTTP client with a global concurrency limit, per-host rate limits and retries
+class AsyncFetcher:
+    def __init__(self, concurrency=CONCURRENCY, rate=REQUESTS_PER_SECOND, burst=BURST,
+                 max_retries=MAX_RETRIES, timeout=TIMEOUT, cache=None, per_host=PER_HOST):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.per_host = per_host or concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.buckets = {}
+        self.host_semaphores = {}
+        # Body bytes downloaded per host
+        self.bytes = {}
+        self.session = None
+        # Optional scraper_cache.ResponseCache; cached pages are revalidated with conditional GETs
+        self.cache = cache
+        # URLs that still failed after every retry
+        self.failed = set()
+
+    async def __aenter__(self):
+        # Keep-alive connections are reused across requests to the same host
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(self.rate, self.burst)
+            self.host_semaphores[host] = asyncio.Semaphore(self.per_host)
+        return self.buckets[host]
+
+    # Fetch a URL, retrying throttled and failed requests; returns None if the host never answered
+    async def get(self, url, headers=None):
+        cached = self.cache.get(url) if self.cache is not None else None
+        if cached is not None:
+            validators = cached.conditional_headers()
+            if cached.status == 200 and validators:
+                headers = {**(headers or {}), **validators}
+            else:
+                cached = None
+
+        response = None
+        for attempt in range(self.max_retries + 1):
+            await self.bucket(url).acquire()
+            host = urlsplit(url).netloc
+            try:
+                # Take the host's slot before a global one, so a busy host cannot hold global slots while waiting
+                async with self.host_semaphores[host], self.semaphore:
+                    async with self.session.get(url, headers=headers) as resp:
+                        body = await resp.read()
+                        self.bytes[host] = self.bytes.get(host, 0) + len(body)
+                        response = FetchResponse(str(resp.url), resp.status, resp.headers, body,
+                                                 resp.get_encoding() if body else None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logging.warning(f"Request to {url} failed: {e!r}")
+                response = None
+            else:
+                if response.status == 304 and cached is not None:
+                    self.cache.touch(url)
+                    return FetchResponse(url, cached.status, cached.headers, cached.body,
+                                         charset(cached.header('Content-Type')), not_modified=True)
+                if response.status == 200 and self.cache is not None:
+                    self.cache.put(url, response.status, response.headers, response.body)
+                if response.status not in RETRY_STATUSES:
+                    return response
+
+            if attempt < self.max_retries:
+                delay = retry_delay(attempt, response)
+                logging.info(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1} of {self.max_retries})")
+                await asyncio.sleep(delay)
+        self.failed.add(url)
+        return response
+
+# Function to read the charset out of a Content-Type header
+def charset(content_type):
+    match = re.search(r'charset=["\']?([\w.:-]+)', content_type or '', re.IGNORECASE)
+    return match.group(1) if match else None
+
+# Function to compute how long to wait before retrying, honouring Retry-After when the server sends it
+def retry_delay(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(RETRY_MAX_DELAY, float(retry_after))
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+    return delay * random.uniform(0.5, 1.0)
+
+# Function to build the URL of a numbered page, keeping any query parameters already on the URL
+def page_url(url, page, param='page'):
+    parts = urlsplit(url)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k != param]
+    query.append((param, str(page)))
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+# Speculative paginator: fetches a sliding window of ?page=N URLs at once and stops at the first
+# empty page, cancelling requests beyond it; follows "next" links when the site ignores ?page=
+class PaginationPlanner:
+    # fetch_page(url) must return (products, next_url); an empty products list ends the crawl
+    def __init__(self, fetch_page, window=PAGE_WINDOW, param='page'):
+        self.fetch_page = fetch_page
+        self.window = max(1, window)
+        self.param = param
+        self.cancelled = 0
+        # The empty page that ended the crawl, to tell a real last page from a failed request
+        self.end_url = None
+
+    # Async generator yielding (url, products) in page order
+    async def pages(self, url):
+        first_url = page_url(url, 1, self.param)
+        products, next_link = await self.fetch_page(first_url)
+        if not products:
+            self.end_url = first_url
+            return
+        yield first_url, products
+
+        numbered = 0
+        async for item in self.numbered_pages(url, products):
+            numbered += 1
+            yield item
+
+        # ?page=2 was empty or a repeat of page 1 but the page links somewhere else: follow the links
+        if numbered == 0 and next_link:
+            next_url = urljoin(first_url, next_link)
+            if next_url != page_url(url, 2, self.param):
+                logging.info(f"{url} does not paginate with ?{self.param}=, following next links")
+                async for item in self.linked_pages(next_url, {first_url}):
+                    yield item
+
+    async def numbered_pages(self, url, previous):
+        tasks = {}
+        page = 2
+        try:
+            while True:
+                # Keep the window full; pages past the end come back empty and are discarded
+                for ahead in range(page, page + self.window):
+                    if ahead not in tasks:
+                        tasks[ahead] = asyncio.ensure_future(self.fetch_page(page_url(url, ahead, self.param)))
+                products, _ = await tasks.pop(page)
+                # An empty page, or the same products again (the parameter is ignored), is the end
+                if not products or products == previous:
+                    self.end_url = page_url(url, page, self.param)
+                    return
+                yield page_url(url, page, self.param), products
+                previous = products
+                page += 1
+        finally:
+            await self.cancel(tasks.values())
+
+    async def linked_pages(self, url, seen):
+        # Each link is only known once the previous page is parsed, so this part stays serial
+        while url and url not in seen:
+            seen.add(url)
+            products, next_link = await self.fetch_page(url)
+            if not products:
+                self.end_url = url
+                return
+            yield url, products
+            url = urljoin(url, next_link) if next_link else None
+
+    async def cancel(self, tasks):
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        self.cancelled += len(pending)
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,234 @@
+import os
+import csv
+import json
+import glob
+import asyncio
+import sqlite3
+import hashlib
+import logging
+import argparse
+import mimetypes
+from urllib.parse import urlsplit
+from concurrent.futures import ProcessPoolExecutor
+from scraper_fetch import AsyncFetcher
+from scraper_extract import FIELDS, MISSING
+from scraper_export import EXPORT_NAME, EXPORT_FORMATS, read_rows
+
+# Image download settings
+IMAGE_FOLDER = 'images'
+IMAGE_INDEX = 'images.sqlite'
+IMAGE_CONCURRENCY = 16  # Downloads in flight
+IMAGE_RATE = 8.0  # Requests per second to one host
+IMAGE_FIELD = 'Image URLs'
+IMAGE_PATH_FIELD = 'Image Path'
+THUMBNAIL_SIZE = (256, 256)
+THUMBNAIL_WORKERS = os.cpu_count() or 2
+
+# Content-addressed image store: files are named by SHA-256 of their bytes and every URL maps to one file
+class ImageStore:
+    def __init__(self, website_folder_path):
+        self.root = os.path.join(website_folder_path, IMAGE_FOLDER)
+        os.makedirs(self.root, exist_ok=True)
+        self.website_folder_path = website_folder_path
+        self.db = sqlite3.connect(os.path.join(self.root, IMAGE_INDEX))
+        self.db.execute("CREATE TABLE IF NOT EXISTS images (url TEXT PRIMARY KEY, sha256 TEXT, path TEXT, size INTEGER)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256)")
+        self.db.commit()
+
+    # Local paths (relative to the website folder) of URLs downloaded on this or an earlier run
+    def known(self, urls):
+        paths = {}
+        urls = list(urls)
+        for start in range(0, len(urls), 500):
+            chunk = urls[start:start + 500]
+            query = f"SELECT url, path FROM images WHERE url IN ({','.join('?' * len(chunk))})"
+            paths.update(self.db.execute(query, chunk).fetchall())
+        return paths
+
+    # Store downloaded bytes; returns (relative path, True if the content was new)
+    def add(self, url, body, content_type=None):
+        digest = hashlib.sha256(body).hexdigest()
+        row = self.db.execute("SELECT path FROM images WHERE sha256 = ? LIMIT 1", (digest,)).fetchone()
+        if row is not None:
+            path, new = row[0], False
+        else:
+            path, new = self.write(digest, body, extension(url, content_type)), True
+        self.db.execute("INSERT OR REPLACE INTO images (url, sha256, path, size) VALUES (?, ?, ?, ?)",
+                        (url, digest, path, len(body)))
+        self.db.commit()
+        return path, new
+
+    def write(self, digest, body, suffix):
+        relative_path = os.path.join(IMAGE_FOLDER, digest[:2], digest + suffix)
+        full_path = os.path.join(self.website_folder_path, relative_path)
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path + '.tmp', 'wb') as f:
+                f.write(body)
+            os.replace(full_path + '.tmp', full_path)
+        return relative_path
+
+    def close(self):
+        self.db.close()
+
+# Function to pick a file extension from the Content-Type, falling back to the URL path
+def extension(url, content_type=None):
+    if content_type:
+        suffix = mimetypes.guess_extension(content_type.split(';')[0].strip())
+        if suffix:
+            return '.jpg' if suffix == '.jpe' else suffix
+    suffix = os.path.splitext(urlsplit(url).path)[1].lower()
+    return suffix if 0 < len(suffix) <= 5 else ''
+
+# Function to write a thumbnail; runs in a worker process because resizing is CPU bound
+def make_thumbnail(source, target, size=THUMBNAIL_SIZE):
+    from PIL import Image
+
+    if os.path.exists(target):
+        return target
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with Image.open(source) as image:
+        image.thumbnail(size)
+        image.convert('RGB').save(target, 'JPEG', quality=85)
+    return target
+
+# Downloads every distinct image URL once with a bounded pool of workers, optionally making thumbnails
+class ImageDownloader:
+    def __init__(self, website_folder_path, concurrency=IMAGE_CONCURRENCY, rate=IMAGE_RATE,
+                 thumbnails=False, thumbnail_workers=THUMBNAIL_WORKERS):
+        self.website_folder_path = website_folder_path
+        self.concurrency = concurrency
+        self.rate = rate
+        self.thumbnails = thumbnails
+        self.thumbnail_workers = thumbnail_workers
+        self.stats = {'urls': 0, 'known': 0, 'downloaded': 0, 'duplicates': 0, 'failed': 0, 'bytes': 0, 'thumbnails': 0}
+
+    # Returns a dict mapping each image URL to its local path
+    async def download(self, urls):
+        urls = {url for url in urls if url and url != MISSING and url.startswith('http')}
+        store = ImageStore(self.website_folder_path)
+        try:
+            paths = store.known(urls)
+            self.stats['urls'] = len(urls)
+            self.stats['known'] = len(paths)
+
+            queue = asyncio.Queue()
+            for url in urls - set(paths):
+                queue.put_nowait(url)
+
+            pool = ProcessPoolExecutor(self.thumbnail_workers) if self.thumbnails else None
+            thumbnail_jobs = []
+            async with AsyncFetcher(concurrency=self.concurrency, rate=self.rate, burst=self.concurrency) as fetcher:
+                async def worker():
+                    while True:
+                        try:
+                            url = queue.get_nowait()
+                        except asyncio.QueueEmpty:
+                            return
+                        response = await fetcher.get(url)
+                        if response is None or response.status != 200 or not response.body:
+                            self.stats['failed'] += 1
+                            logging.warning(f"Could not download image {url}")
+                            continue
+                        path, new = store.add(url, response.body, response.headers.get('Content-Type'))
+                        paths[url] = path
+                        self.stats['bytes'] += len(response.body)
+                        self.stats['downloaded' if new else 'duplicates'] += 1
+                        if new and pool is not None:
+                            thumbnail_jobs.append(self.submit_thumbnail(pool, path))
+
+                await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+            if pool is not None:
+                for result in await asyncio.gather(*thumbnail_jobs, return_exceptions=True):
+                    if isinstance(result, Exception):
+                        logging.warning(f"Could not make thumbnail: {result!r}")
+                    else:
+                        self.stats['thumbnails'] += 1
+                pool.shutdown()
+            return paths
+        finally:
+            store.close()
+
+    def summary(self):
+        stats = self.stats
+        return (f"{stats['urls']} distinct image URLs: {stats['known']} already stored, {stats['downloaded']} downloaded, "
+                f"{stats['duplicates']} duplicates of stored images, {stats['failed']} failed "
+                f"({stats['bytes'] / 1024 / 1024:.1f} MB); {stats['thumbnails']} thumbnails made")
+
+    def submit_thumbnail(self, pool, path):
+        source = os.path.join(self.website_folder_path, path)
+        name = os.path.splitext(os.path.basename(path))[0] + '.jpg'
+        target = os.path.join(self.website_folder_path, IMAGE_FOLDER, 'thumbnails', name[:2], name)
+        return asyncio.wrap_future(pool.submit(make_thumbnail, source, target))
+
+# Function to rewrite one export file with an Image Path column, streaming it through a temporary file
+def add_image_paths(path, fmt, paths):
+    temp_path = path + '.tmp'
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path)
+        column = pa.array([paths.get(url, MISSING) for url in table.column(IMAGE_FIELD).to_pylist()])
+        if IMAGE_PATH_FIELD in table.column_names:
+            table = table.set_column(table.column_names.index(IMAGE_PATH_FIELD), IMAGE_PATH_FIELD, column)
+        else:
+            table = table.append_column(IMAGE_PATH_FIELD, column)
+        pq.write_table(table, temp_path)
+    elif fmt == 'csv':
+        with open(path, newline='', encoding='utf-8') as source, open(temp_path, 'w', newline='', encoding='utf-8') as target:
+            reader = csv.reader(source)
+            writer = csv.writer(target)
+            header = next(reader)
+            if IMAGE_PATH_FIELD not in header:
+                header.append(IMAGE_PATH_FIELD)
+            writer.writerow(header)
+            url_column = header.index(IMAGE_FIELD)
+            path_column = header.index(IMAGE_PATH_FIELD)
+            for row in reader:
+                row[path_column:path_column + 1] = [paths.get(row[url_column], MISSING)]
+                writer.writerow(row)
+    else:
+        with open(path, encoding='utf-8') as source, open(temp_path, 'w', encoding='utf-8') as target:
+            for line in source:
+                record = json.loads(line)
+                record[IMAGE_PATH_FIELD] = paths.get(record.get(IMAGE_FIELD), MISSING)
+                target.write(json.dumps(record, ensure_ascii=False) + '\n')
+    os.replace(temp_path, path)
+
+# Function to download the images of an export (a file or a folder of batch files) and record
+# their local paths in it; returns the downloader, whose stats describe the run
+async def localize_images(export_path, fmt, website_folder_path, thumbnails=False, concurrency=IMAGE_CONCURRENCY):
+    url_index = FIELDS.index(IMAGE_FIELD)
+    urls = await asyncio.to_thread(lambda: {row[url_index] for row in read_rows(export_path, fmt)})
+
+    downloader = ImageDownloader(website_folder_path, concurrency=concurrency, thumbnails=thumbnails)
+    paths = await downloader.download(urls)
+
+    files = sorted(glob.glob(os.path.join(export_path, f'*.{fmt}'))) if os.path.isdir(export_path) else [export_path]
+    for path in files:
+        await asyncio.to_thread(add_image_paths, path, fmt, paths)
+    logging.info(f"Images for {export_path}: {downloader.stats}")
+    return downloader
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the product images of a scraped site")
+    parser.add_argument('website_folder', help="The site's folder under Website Data")
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv', help="Format of the export to update")
+    parser.add_argument('--export', help="Export file or folder (default: the scraped_product_data export in the folder)")
+    parser.add_argument('--concurrency', type=int, default=IMAGE_CONCURRENCY, help="Downloads in flight")
+    parser.add_argument('--thumbnails', action='store_true', help="Also make thumbnails in a pool of worker processes")
+    args = parser.parse_args()
+
+    export_path = args.export
+    if export_path is None:
+        # Web-Scrap.py writes a single file, the Scrapy feeds a folder of batches
+        export_path = os.path.join(args.website_folder, f"{EXPORT_NAME}.{args.format}")
+        if not os.path.exists(export_path):
+            export_path = os.path.join(args.website_folder, EXPORT_NAME)
+
+    downloader = asyncio.run(localize_images(export_path, args.format, args.website_folder, args.thumbnails, args.concurrency))
+    print(downloader.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+from scraper_extract import FIELDS, MISSING
+
+# Default index settings
+INDEX_FILE = 'product_index.sqlite'
+CHANGES_FOLDER = 'changes'
+
+# Function to build a stable identity for a product: model number, then name, then image URL
+def product_key(row, fields=FIELDS):
+    values = dict(zip(fields, row))
+    for field, prefix in (('Model Number', 'model'), ('Product Name', 'name'), ('Image URLs', 'image')):
+        value = values.get(field, MISSING)
+        if value and value != MISSING:
+            return f"{prefix}:{hashlib.sha1(value.encode('utf-8')).hexdigest()}"
+    return None
+
+# Function to fingerprint a product's content
+def fingerprint(row):
+    return hashlib.sha1(json.dumps(list(row), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# Persistent SQLite index of every product seen on a site, used to report what changed between crawls
+class ProductIndex:
+    def __init__(self, path, fields=FIELDS):
+        self.path = path
+        self.fields = fields
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT, data TEXT, page TEXT, first_run INTEGER, last_run INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS products_page ON products (page)")
+        # Which products each page held, so an unchanged page marks them all as seen in one statement
+        self.db.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, fingerprint TEXT, last_run INTEGER)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, started REAL, finished REAL, "
+            "new INTEGER DEFAULT 0, changed INTEGER DEFAULT 0, removed INTEGER DEFAULT 0, skipped_pages INTEGER DEFAULT 0)"
+        )
+        self.db.commit()
+        self.run = None
+        self.counts = {'new': 0, 'changed': 0, 'removed': 0, 'skipped_pages': 0}
+
+    # Start a run, or continue an interrupted one (a resumed Scrapy job) so the products it already saw still count
+    def begin_run(self, run=None):
+        row = None
+        if run is not None:
+            row = self.db.execute("SELECT new, changed, skipped_pages FROM runs WHERE id = ?", (run,)).fetchone()
+        if row is not None:
+            self.run = run
+            self.counts = {'new': row[0], 'changed': row[1], 'removed': 0, 'skipped_pages': row[2]}
+            return self.run
+        self.run = self.db.execute("INSERT INTO runs (started) VALUES (?)", (time.time(),)).lastrowid
+        self.counts = {'new': 0, 'changed': 0, 'removed': 0, 'skipped_pages': 0}
+        self.db.commit()
+        return self.run
+
+    # Record the products found on a page; returns change records for new and changed products
+    def record_page(self, url, rows):
+        products = {}
+        for row in rows:
+            key = product_key(row, self.fields)
+            if key is not None:
+                products[key] = (fingerprint(row), row)
+        page_fingerprint = hashlib.sha1(''.join(sorted(fp for fp, _ in products.values())).encode()).hexdigest()
+
+        stored = self.db.execute("SELECT fingerprint FROM pages WHERE url = ?", (url,)).fetchone()
+        if stored is not None and stored[0] == page_fingerprint:
+            # Same products as last time: no per-product work at all
+            self.db.execute("UPDATE products SET last_run = ? WHERE page = ?", (self.run, url))
+            self.db.execute("UPDATE pages SET last_run = ? WHERE url = ?", (self.run, url))
+            self.db.commit()
+            self.counts['skipped_pages'] += 1
+            return []
+
+        changes = []
+        known = {}
+        keys = list(products)
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            query = f"SELECT key, fingerprint FROM products WHERE key IN ({','.join('?' * len(chunk))})"
+            known.update(self.db.execute(query, chunk).fetchall())
+
+        for key, (product_fingerprint, row) in products.items():
+            if key not in known:
+                changes.append(self.change('new', key, row))
+            elif known[key] != product_fingerprint:
+                changes.append(self.change('changed', key, row))
+        self.db.executemany(
+            "INSERT INTO products (key, fingerprint, data, page, first_run, last_run) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET fingerprint = excluded.fingerprint, data = excluded.data, "
+            "page = excluded.page, last_run = excluded.last_run",
+            [(key, fp, json.dumps(list(row), ensure_ascii=False), url, self.run, self.run)
+             for key, (fp, row) in products.items()],
+        )
+        self.db.execute(
+            "INSERT INTO pages (url, fingerprint, last_run) VALUES (?, ?, ?) "
+            "ON CONFLICT(url) DO UPDATE SET fingerprint = excluded.fingerprint, last_run = excluded.last_run",
+            (url, page_fingerprint, self.run),
+        )
+        self.db.commit()
+        return changes
+
+    # Close the run; products not seen in it are reported removed unless the crawl was incomplete
+    def finish_run(self, remove=True):
+        removed = []
+        if remove:
+            for key, data in self.db.execute("SELECT key, data FROM products WHERE last_run < ?", (self.run,)).fetchall():
+                removed.append(self.change('removed', key, json.loads(data)))
+            self.db.execute("DELETE FROM products WHERE last_run < ?", (self.run,))
+            self.db.execute("DELETE FROM pages WHERE last_run < ?", (self.run,))
+        self.counts['removed'] = len(removed)
+        self.db.execute(
+            "UPDATE runs SET finished = ?, new = ?, changed = ?, removed = ?, skipped_pages = ? WHERE id = ?",
+            (time.time(), self.counts['new'], self.counts['changed'], self.counts['removed'],
+             self.counts['skipped_pages'], self.run),
+        )
+        self.db.commit()
+        return removed
+
+    def change(self, kind, key, row):
+        if kind != 'removed':
+            self.counts[kind] += 1
+        return {'change': kind, 'key': key, **dict(zip(self.fields, row))}
+
+    def close(self):
+        self.db.close()
+
+# Function to write a run's change records as JSON Lines under <folder>/changes; returns the file path
+def write_changes(changes, folder):
+    changes_folder = os.path.join(folder, CHANGES_FOLDER)
+    os.makedirs(changes_folder, exist_ok=True)
+    path = os.path.join(changes_folder, time.strftime('%Y%m%d-%H%M%S') + '.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        for change in changes:
+            f.write(json.dumps(change, ensure_ascii=False) + '\n')
+    logging.info(f"Wrote {len(changes)} product changes to {path}")
+    return path
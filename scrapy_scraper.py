@@ -1,9 +1,40 @@
 import os
+import json
+import inspect
+import shutil
+import hashlib
+import asyncio
 import platform
-import pandas as pd
 import scrapy
+from scrapy import signals
 from scrapy.crawler import CrawlerProcess
+from scrapy.exporters import BaseItemExporter
+from scrapy.extensions.throttle import AutoThrottle
+from scrapy.spidermiddlewares.httperror import HttpError
 from scrapy.utils.project import get_project_settings
+from scraper_extract import EXTRACTOR, FIELDS
+from scraper_cache import shared_cache_path
+from scraper_index import ProductIndex, INDEX_FILE, write_changes
+from scraper_export import EXPORT_NAME, convert_to_excel
+from scraper_fetch import page_url
+from scraper_images import localize_images, IMAGE_PATH_FIELD
+
+# Crawl settings, overridable through run_scrapy
+CONCURRENT_REQUESTS = 16
+CONCURRENT_REQUESTS_PER_DOMAIN = 8
+AUTOTHROTTLE = True  # Adapt the request rate to the site's response times
+AUTOTHROTTLE_TARGET_CONCURRENCY = 4.0
+AUTOTHROTTLE_START_DELAY = 0.25  # Seconds between requests before any response is timed (Scrapy's default is 5)
+AUTOTHROTTLE_MAX_DELAY = 10.0  # Slowest the throttle backs off to on a struggling site
+HTTP_CACHE = True
+PAGE_WINDOW = 8  # Numbered pages requested ahead of the last one that had products
+JOB_DIR = '.scrapy-job'  # Scheduler state kept while a crawl runs, so an interrupted one resumes
+
+# Export settings: feed exports write batches of rows as the crawl runs, then optionally converted to Excel
+EXPORT_FORMAT = 'csv'  # csv, jsonl or parquet
+EXPORT_BATCH_SIZE = 500
+EXPORT_EXCEL = True
+FEED_FORMATS = {'csv': 'csv', 'jsonl': 'jsonlines', 'parquet': 'parquet'}
 
 # Function to determine the Documents path based on OS
 def get_documents_path():
@@ -12,81 +43,254 @@ def get_documents_path():
     else:
         return os.path.join(os.path.expanduser("~"), "Documents")
 
+# Function to get the output folder for a site, creating it if needed
+def get_website_folder(url):
+    data_folder = os.path.join(get_documents_path(), "Website Data")
+    website_name = url.split("//")[-1].split("/")[0]  # Extract the domain name
+    website_folder_path = os.path.join(data_folder, website_name)
+
+    if not os.path.exists(website_folder_path):
+        os.makedirs(website_folder_path)
+    return website_folder_path
+
+class ProductItem(scrapy.Item):
+    name = scrapy.Field()
+    price = scrapy.Field()
+    description = scrapy.Field()
+    model_number = scrapy.Field()
+    image_url = scrapy.Field()
+    # Page the product came from and how many products that page held, for the index pipeline
+    page = scrapy.Field()
+    page_products = scrapy.Field()
+
+# Item fields written to the feeds, mapped to the column names both scrapers use
+ITEM_COLUMNS = dict(zip(('name', 'price', 'description', 'model_number', 'image_url'), FIELDS))
+
 class ProductSpider(scrapy.Spider):
     name = "products"
 
-    def __init__(self, url=None, *args, **kwargs):
+    def __init__(self, url=None, page_window=PAGE_WINDOW, *args, **kwargs):
         super(ProductSpider, self).__init__(*args, **kwargs)
         self.start_urls = [url]
-        self.page = 1
-        self.all_data = {
-            'Product Name': [],
-            'Price': [],
-            'Description': [],
-            'Model Number': [],
-            'Image URLs': [],
-        }
+        self.page_window = int(page_window)
+        # Pages that could not be fetched; while any exist, products missing from the crawl are not reported removed
+        self.failed = []
+        # First URL that showed each set of products on the numbered pages, to spot a page served again
+        self.page_fingerprints = {}
+        # Kept in the job folder across an interruption: pages whose products are already in the feed batches,
+        # products exported and the product index run (replaced by Scrapy with the saved state when resuming)
+        self.state = {}
 
     def parse(self, response):
-        product_containers = response.xpath("//*[contains(@class, 'product') or contains(@class, 'item')]")
-        
-        if not product_containers:
-            self.log("No products found. Ending scrape.")
-            self.save_data()
+        # Pages served from the response cache were parsed on an earlier run
+        cache = getattr(self, 'response_cache', None)
+        parsed = cache.get_parsed(response.url) if cache is not None and 'cached' in response.flags else None
+        if parsed is not None:
+            rows, next_page = parsed
+        else:
+            # Reuse the tree Scrapy already parsed; the extractor is shared with Web-Scrap.py
+            rows, next_page = EXTRACTOR.extract_tree(response.selector.root, response.url)
+            if cache is not None:
+                cache.put_parsed(response.url, [rows, next_page])
+
+        if not rows:
+            self.logger.info(f"No products found on {response.url}.")
             return
 
-        for product in product_containers:
-            name = product.xpath(".//h2[contains(@class, 'name') or contains(@class, 'title')]/text()").get(default='N/A').strip()
-            price = product.xpath(".//span[contains(@class, 'price') or contains(@class, 'amount')]/text()").get(default='N/A').strip()
-            description = product.xpath(".//p[contains(@class, 'description') or contains(@class, 'detail')]/text()").get(default='N/A').strip()
-            model = product.xpath(".//span[contains(@class, 'model') or contains(@class, 'sku')]/text()").get(default='N/A').strip()
-            image_url = product.xpath(".//img[contains(@class, 'image') or contains(@class, 'img')]/@src").get(default='N/A')
-            
-            # Handle image URL
-            if image_url and not image_url.startswith('http'):
-                image_url = response.urljoin(image_url)
-
-            # Append data to respective lists
-            self.all_data['Product Name'].append(name)
-            self.all_data['Price'].append(price)
-            self.all_data['Description'].append(description)
-            self.all_data['Model Number'].append(model)
-            self.all_data['Image URLs'].append(image_url)
-
-        # Proceed to next page if pagination exists
-        next_page = response.xpath("//a[contains(@class, 'next')]/@href").get()
-        if next_page:
-            next_page_url = response.urljoin(next_page)
-            self.page += 1
-            yield scrapy.Request(next_page_url, callback=self.parse)
-        else:
-            self.log(f"Scraping completed. {self.page} pages scraped.")
-            self.save_data()
-
-    def save_data(self):
-        # Save data to an Excel file
-        documents_path = get_documents_path()
-        data_folder = os.path.join(documents_path, "Website Data")
-        
-        if not os.path.exists(data_folder):
-            os.makedirs(data_folder)
-
-        website_name = self.start_urls[0].split("//")[-1].split("/")[0]  # Extract the domain name
-        website_folder_path = os.path.join(data_folder, website_name)
-
-        if not os.path.exists(website_folder_path):
-            os.makedirs(website_folder_path)
-
-        output_file = os.path.join(website_folder_path, 'scraped_product_data.xlsx')
-        df = pd.DataFrame(self.all_data)
-        df.to_excel(output_file, index=False)
-        self.log(f"Data successfully saved to {output_file}")
-
-def run_scrapy(url):
-    process = CrawlerProcess(settings=get_project_settings())
-    process.crawl(ProductSpider, url=url)
+        # Some sites answer ?page=N past the end with the last page (or the first) instead of an empty one;
+        # a numbered page repeating another page's products ends its branch, as in PaginationPlanner
+        page = response.meta.get('page', 1)
+        if page == 1 or response.meta.get('numbered'):
+            fingerprint = hashlib.sha1(json.dumps(rows).encode('utf-8')).hexdigest()
+            first_url = self.page_fingerprints.setdefault(fingerprint, response.url)
+            if first_url != response.url:
+                self.logger.info(f"{response.url} repeats the products of {first_url}; treating it as the end.")
+                return
+
+        # A resumed crawl fetches the start page again, but its products are already in the feed batches
+        if response.url not in self.state.get('exported_pages', ()):
+            for row in rows:
+                yield ProductItem(page=response.url, page_products=len(rows), **dict(zip(ITEM_COLUMNS, row)))
+
+        # Numbered pagination: keep a window of upcoming pages queued so Scrapy downloads them concurrently;
+        # the first empty or repeated page ends its own branch and the few requests past it come back the same
+        if response.meta.get('numbered'):
+            yield self.numbered_request(page + self.page_window)
+        elif page == 1 and next_page and response.urljoin(next_page) == page_url(self.start_urls[0], 2):
+            for ahead in range(2, 2 + self.page_window):
+                yield self.numbered_request(ahead)
+        elif next_page:
+            # Other sites are walked one "next" link at a time
+            yield response.follow(next_page, callback=self.parse, errback=self.page_failed, meta={'page': None})
+
+    def numbered_request(self, page):
+        return scrapy.Request(page_url(self.start_urls[0], page), callback=self.parse, errback=self.page_failed,
+                              meta={'page': page, 'numbered': True})
+
+    def page_failed(self, failure):
+        # A 404 or 410 past the last page is just the end of the catalogue
+        if failure.check(HttpError) and failure.value.response.status in (404, 410):
+            return
+        self.failed.append(failure.request.url)
+        self.logger.warning(f"Could not fetch {failure.request.url}: {failure.value!r}")
+
+# AutoThrottle that counts a 304 as a normal response. Scrapy's only lowers its delay after a 200, and with
+# the HTTP cache on it sees the raw 304 of every revalidated page, so a recrawl would stay at the start delay.
+# _adjust_delay is private to Scrapy; run_scrapy checks it with supported() before relying on it
+class RevalidationAutoThrottle(AutoThrottle):
+    def _adjust_delay(self, slot, latency, response):
+        if response.status == 304:
+            response = response.replace(status=200)
+        super()._adjust_delay(slot, latency, response)
+
+    # True while the installed Scrapy still has the hook this class overrides, with the same arguments
+    @staticmethod
+    def supported():
+        adjust_delay = getattr(AutoThrottle, '_adjust_delay', None)
+        return adjust_delay is not None and list(inspect.signature(adjust_delay).parameters) == [
+            'self', 'slot', 'latency', 'response']
+
+# Item pipeline recording every page in the site's product index, one batched write per page
+class ProductIndexPipeline:
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = cls()
+        pipeline.crawler = crawler
+        crawler.signals.connect(pipeline.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(pipeline.spider_closed, signal=signals.spider_closed)
+        return pipeline
+
+    # The spider argument is optional: newer Scrapy releases no longer pass it
+    def open_spider(self, spider=None):
+        self.folder = get_website_folder(self.crawler.spider.start_urls[0])
+        # Products seen on earlier runs of this site, to report only what changed
+        self.index = ProductIndex(os.path.join(self.folder, INDEX_FILE))
+        self.pages = {}
+        self.changes = []
+
+    # The job state is loaded when the spider opens, after open_spider; a resumed crawl continues its index run
+    def spider_opened(self, spider):
+        spider.state['index_run'] = self.index.begin_run(spider.state.get('index_run'))
+        spider.state.setdefault('exported_pages', set())
+        spider.state.setdefault('exported_items', 0)
+
+    def process_item(self, item, spider=None):
+        # Items of one page can interleave with other pages' items; a page is written once all have arrived
+        state = self.crawler.spider.state
+        state['exported_items'] += 1
+        rows = self.pages.setdefault(item['page'], [])
+        rows.append(tuple(item.get(field, 'N/A') for field in ITEM_COLUMNS))
+        if len(rows) >= item['page_products']:
+            self.changes.extend(self.index.record_page(item['page'], self.pages.pop(item['page'])))
+            state['exported_pages'].add(item['page'])
+        return item
+
+    def spider_closed(self, spider, reason):
+        # Products can only be reported removed when the crawl finished without losing a page
+        complete = reason == 'finished' and not spider.failed
+        self.changes.extend(self.index.finish_run(remove=complete))
+        changes_file = write_changes(self.changes, self.folder)
+        spider.logger.info(f"{self.index.counts['new']} new, {self.index.counts['changed']} changed and "
+                           f"{self.index.counts['removed']} removed products. Changes written to {changes_file}")
+        self.index.close()
+
+# Feed exporter writing Parquet; every feed batch file is written as one table when it is finished
+class ParquetItemExporter(BaseItemExporter):
+    def __init__(self, file, **kwargs):
+        super().__init__(dont_fail=True, **kwargs)
+        self.file = file
+        self.columns = {}
+
+    def export_item(self, item):
+        # Older Scrapy releases only have the underscored name
+        serialized_fields = getattr(self, 'get_serialized_fields', None) or self._get_serialized_fields
+        for name, value in serialized_fields(item, default_value='N/A'):
+            self.columns.setdefault(name, []).append(value)
+
+    def finish_exporting(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        pq.write_table(pa.table(self.columns), self.file)
+
+def run_scrapy(url, export_format=EXPORT_FORMAT, concurrent_requests=CONCURRENT_REQUESTS,
+               concurrent_requests_per_domain=CONCURRENT_REQUESTS_PER_DOMAIN, autothrottle=AUTOTHROTTLE,
+               autothrottle_start_delay=AUTOTHROTTLE_START_DELAY, autothrottle_max_delay=AUTOTHROTTLE_MAX_DELAY,
+               http_cache=HTTP_CACHE, page_window=PAGE_WINDOW, resume=True, download_images=False, thumbnails=False):
+    website_folder_path = get_website_folder(url)
+    feed_folder = os.path.join(website_folder_path, EXPORT_NAME)
+    job_dir = os.path.join(website_folder_path, JOB_DIR)
+
+    # A job folder left by an interrupted crawl is resumed, keeping the feed batches it already wrote
+    if resume and os.path.isdir(job_dir):
+        print("Resuming an interrupted crawl.")
+    else:
+        shutil.rmtree(job_dir, ignore_errors=True)
+        shutil.rmtree(feed_folder, ignore_errors=True)
+
+    settings = get_project_settings()
+    settings.set('CONCURRENT_REQUESTS', concurrent_requests)
+    settings.set('CONCURRENT_REQUESTS_PER_DOMAIN', concurrent_requests_per_domain)
+    if autothrottle and http_cache and not RevalidationAutoThrottle.supported():
+        # Scrapy's own AutoThrottle would keep every recrawl at the start delay
+        print("This Scrapy version's AutoThrottle cannot be adapted to cached pages; crawling without it.")
+        autothrottle = False
+    settings.set('AUTOTHROTTLE_ENABLED', autothrottle)
+    settings.set('AUTOTHROTTLE_TARGET_CONCURRENCY', AUTOTHROTTLE_TARGET_CONCURRENCY)
+    settings.set('AUTOTHROTTLE_START_DELAY', autothrottle_start_delay)
+    settings.set('AUTOTHROTTLE_MAX_DELAY', autothrottle_max_delay)
+    if autothrottle and RevalidationAutoThrottle.supported():
+        # Added to the project's extensions, in place of the stock AutoThrottle
+        extensions = settings.getdict('EXTENSIONS')
+        extensions.update({'scrapy.extensions.throttle.AutoThrottle': None, RevalidationAutoThrottle: 0})
+        settings.set('EXTENSIONS', extensions)
+    if http_cache:
+        # Keep responses between runs and revalidate them with ETag/Last-Modified instead of refetching
+        settings.set('HTTPCACHE_ENABLED', True)
+        settings.set('HTTPCACHE_STORAGE', 'scraper_cache.ScrapyCacheStorage')
+        settings.set('HTTPCACHE_POLICY', 'scrapy.extensions.httpcache.RFC2616Policy')
+        # The same file Web-Scrap.py uses, so pages fetched by either scraper are revalidated by the other
+        settings.set('RESPONSE_CACHE_PATH', shared_cache_path())
+    settings.set('ITEM_PIPELINES', {ProductIndexPipeline: 300})
+    settings.set('FEED_EXPORTERS', {'parquet': ParquetItemExporter})
+    # Each batch of rows becomes its own file, so a crash loses at most the batch being written
+    settings.set('FEEDS', {
+        os.path.join(feed_folder, f'%(batch_time)s-%(batch_id)05d.{export_format}'): {
+            'format': FEED_FORMATS[export_format],
+            'fields': ITEM_COLUMNS,
+            'batch_item_count': EXPORT_BATCH_SIZE,
+            'encoding': 'utf8',
+        },
+    })
+    settings.set('JOBDIR', job_dir)
+
+    process = CrawlerProcess(settings=settings)
+    crawler = process.create_crawler(ProductSpider)
+    process.crawl(crawler, url=url, page_window=page_window)
     process.start()
 
+    # The crawl's stats are returned for callers such as the benchmark harness
+    stats = crawler.stats.get_stats()
+    if stats.get('finish_reason') != 'finished':
+        print("The crawl was interrupted. Run again to resume it.")
+        return stats
+    shutil.rmtree(job_dir, ignore_errors=True)
+    # Products exported by an interrupted run count too
+    print(f"{crawler.spider.state['exported_items']} products exported to {feed_folder}")
+
+    # Optional image stage: download each distinct product image once and add its local path to the feed batches
+    fields = FIELDS
+    if download_images:
+        downloader = asyncio.run(localize_images(feed_folder, export_format, website_folder_path, thumbnails))
+        print(downloader.summary())
+        fields = FIELDS + (IMAGE_PATH_FIELD,)
+
+    # Excel is an optional final step, converted from the feed batches
+    if EXPORT_EXCEL:
+        output_file = convert_to_excel(feed_folder, export_format, os.path.join(website_folder_path, 'scraped_product_data.xlsx'), fields)
+        print(f"Data successfully saved to {output_file}")
+    return stats
+
 if __name__ == "__main__":
     # Ask for the URL
     url = input("Please enter the website URL to scrape: ")
@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import importlib.util
+from types import SimpleNamespace
+import numpy as np
+import pytest
+import torch
+from torch import nn
+
+# The script's file name is not a valid module name, so it is loaded from its path
+spec = importlib.util.spec_from_file_location(
+    'multy_stream_yolo', os.path.join(os.path.dirname(__file__), '..', 'multy-stream-yolo.py'))
+yolo = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(yolo)
+
+DEVICES = ['cpu', pytest.param('cuda:0', marks=pytest.mark.skipif(not torch.cuda.is_available(), reason="no CUDA device"))]
+IMAGE_SIZE = 32
+
+
+# Stand-in for YOLOv5's Detect head: like the real one it builds its grid on the device of its own
+# parameters while running, which a trace records as a constant
+class Detect(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.register_buffer('anchors', torch.ones(2))
+        self.export = False
+
+    def forward(self, x):
+        grid = torch.arange(x.shape[-1], device=self.anchors.device, dtype=x.dtype)
+        return (x + grid).flatten(1)
+
+
+class TinyYolo(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.conv = nn.Conv2d(3, 4, 3, stride=8, padding=1)
+        self.detect = Detect()
+        self.stride = torch.tensor([8.0])
+        self.names = ['person', 'car']
+
+    def forward(self, x):
+        return self.detect(self.conv(x))
+
+
+def load_export(path, device):
+    extra_files = {'config.txt': ''}
+    # DetectMultiBackend loads TorchScript exports the same way
+    model = torch.jit.load(path, _extra_files=extra_files, map_location=device)
+    return model, json.loads(extra_files['config.txt'])
+
+
+@pytest.mark.parametrize('device', DEVICES)
+def test_export_runs_on_the_device_it_was_traced_for(tmp_path, device):
+    path = str(tmp_path / 'model.torchscript')
+    yolo.export_torchscript(TinyYolo(), path, torch.device(device), IMAGE_SIZE)
+
+    model, config = load_export(path, device)
+    output = model(torch.zeros(2, 3, IMAGE_SIZE, IMAGE_SIZE, device=device))
+    assert output.device == torch.device(device)
+    assert config == {'shape': [1, 3, IMAGE_SIZE, IMAGE_SIZE], 'stride': 8, 'names': {'0': 'person', '1': 'car'}}
+
+
+@pytest.mark.parametrize('device', DEVICES)
+def test_prepare_weights_caches_one_export_per_device(tmp_path, monkeypatch, device):
+    weights = tmp_path / 'best.pt'
+    weights.write_bytes(b'weights')
+    loads = []
+
+    def hub_load(repo, model, path, source, device):
+        loads.append(device)
+        return SimpleNamespace(model=SimpleNamespace(model=TinyYolo()))
+
+    monkeypatch.setattr(yolo.torch.hub, 'load', hub_load)
+    cache_dir = str(tmp_path / 'cache')
+    cached = yolo.prepare_weights(str(weights), 'repo', 'local', cache_dir, IMAGE_SIZE, device)
+    assert cached.endswith(f"-{IMAGE_SIZE}-{device.replace(':', '')}.torchscript")
+    assert loads == [device]
+
+    # The second start reuses the export without loading the weights
+    assert yolo.prepare_weights(str(weights), 'repo', 'local', cache_dir, IMAGE_SIZE, device) == cached
+    assert loads == [device]
+
+    model, _ = load_export(cached, device)
+    assert model(torch.zeros(1, 3, IMAGE_SIZE, IMAGE_SIZE, device=device)).device == torch.device(device)
+
+
+def fps_gauge(text, metric):
+    return [float(line.split()[-1]) for line in text.splitlines() if line.startswith(metric + '{')]
+
+
+def test_metrics_report_rates_without_the_reporter_thread():
+    streams = len(yolo.streams)
+    stats = np.zeros((streams, yolo.NUM_STATS))
+    timings = SimpleNamespace(counts=np.zeros((streams, len(yolo.STAGE_NAMES), len(yolo.LATENCY_BUCKETS) + 1), np.int64),
+                              sums=np.zeros((streams, len(yolo.STAGE_NAMES))))
+    # --stats-interval 0: the reporter thread is never started
+    reporter = yolo.MetricsReporter(stats, timings, interval=0)
+    reporter.last_scrape = (time.monotonic() - 2, stats.copy())
+    stats[:, yolo.STAT_CAPTURED] = 20
+    stats[:, yolo.STAT_PROCESSED] = 10
+
+    text = reporter.prometheus_text()
+    assert fps_gauge(text, 'yolo_capture_fps') == pytest.approx([10] * streams, rel=0.1)
+    assert fps_gauge(text, 'yolo_inference_fps') == pytest.approx([5] * streams, rel=0.1)
@@ -1,4 +1,5 @@
 import os
+import time
 import yt_dlp  # type: ignore
 from datetime import datetime
 from tqdm import tqdm  # type: ignore
@@ -6,6 +7,12 @@ from colorama import Fore, init  # type: ignore
 import glob
 import platform
 import shutil
+import threading
+from queue import Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from yt_info_cache import InfoCache, INFO_CACHE_FILE, extract_info, download_info, entry_key, cache_key
+from yt_archive import DownloadArchive
+from yt_transfer import BandwidthLimiter, transfer_options, adopt_partials
 
 # Initialize colorama
 init(autoreset=True)
@@ -13,6 +20,19 @@ init(autoreset=True)
 # Global variable to keep track of progress
 progress_bar = None
 
+# Playlist settings: entries downloaded at once, and attempts per entry before it is reported failed
+PLAYLIST_WORKERS = 4
+ITEM_RETRIES = 3
+RETRY_DELAY = 5  # Seconds before the first retry, doubled after each failed attempt
+
+# Videos downloaded on an earlier day are skipped; set this to hard-link them into today's folder instead
+LINK_ARCHIVED = False
+
+# Transfer settings: fragments fetched at once per video, and a cap in bytes/sec shared by every download
+# running at the same time, e.g. 5 * 1024 * 1024 (None for no cap)
+FRAGMENT_WORKERS = 8
+BANDWIDTH_LIMIT = None
+
 # Progress hook function to update the progress bar
 def progress_hook(d):
     global progress_bar
@@ -36,6 +56,112 @@ def progress_hook(d):
         progress_bar = None
         print(f"{Fore.CYAN}\nDownload completed: {d['filename']}")
 
+# Progress for a playlist downloaded by several workers: one bar per active entry plus an overall bar
+# with the combined bytes/sec, ETA and the number of entries done
+class PlaylistProgress:
+    def __init__(self, items, workers):
+        self.items = items
+        self.done = 0
+        self.failed = 0
+        self.lock = threading.Lock()
+        # Bytes downloaded and expected per file; an entry can be several files (video and audio streams)
+        self.files = {}
+        self.overall = tqdm(total=0, unit='B', unit_scale=True, desc=f"{Fore.GREEN}Playlist", position=0,
+                            mininterval=0.5, colour='green')
+        self.positions = Queue()
+        for position in range(1, workers + 1):
+            self.positions.put(position)
+        self.update_postfix()
+
+    # Returns a progress hook for one entry, drawing its own bar in a free row below the overall bar
+    def hook(self, title):
+        position = self.positions.get()
+        bar = tqdm(total=None, unit='B', unit_scale=True, desc=f"{Fore.YELLOW}{title[:30]}", position=position,
+                   leave=False, mininterval=0.5)
+
+        def progress(d):
+            if d['status'] not in ('downloading', 'finished'):
+                return
+            total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+            downloaded = d.get('downloaded_bytes') or total
+            with self.lock:
+                previous_downloaded, previous_total = self.files.get(d['filename'], (0, 0))
+                self.files[d['filename']] = (downloaded, total)
+                if total != previous_total:
+                    self.overall.total += total - previous_total
+                    self.overall.refresh()
+                self.overall.update(downloaded - previous_downloaded)
+                if total and bar.total != total:
+                    bar.reset(total)
+                bar.update(downloaded - bar.n)
+
+        def close():
+            bar.close()
+            self.positions.put(position)
+
+        return progress, close
+
+    def item_finished(self, ok):
+        with self.lock:
+            if ok:
+                self.done += 1
+            else:
+                self.failed += 1
+            self.update_postfix()
+
+    def update_postfix(self):
+        failed = f", {self.failed} failed" if self.failed else ""
+        self.overall.set_postfix_str(f"{self.done}/{self.items} items{failed}")
+
+    def close(self):
+        self.overall.close()
+
+# Function to download one playlist entry with its own YoutubeDL, retrying it independently of the others
+def download_entry(entry, ydl_opts, progress, cache=None, archive=None, limiter=None):
+    url = entry.get('webpage_url') or entry.get('url')
+    title = entry.get('title') or url
+    hook, close = progress.hook(title)
+    # Each worker needs its own YoutubeDL; partial files are kept so a retry resumes where the last attempt stopped
+    hooks = [hook, limiter.hook] if limiter is not None else [hook]
+    opts = dict(ydl_opts, progress_hooks=hooks, noprogress=True, quiet=True, noplaylist=True, continuedl=True)
+    delay = RETRY_DELAY
+    try:
+        for attempt in range(1, ITEM_RETRIES + 1):
+            try:
+                with yt_dlp.YoutubeDL(opts) as ydl:
+                    if archive is not None:
+                        archive.attach(ydl)
+                    info = extract_info(ydl, url, cache, entry_key(entry))
+                    if download_info(ydl, info, cache):
+                        return title, None
+                error = "yt-dlp reported an error"
+            except Exception as e:
+                error = str(e)
+            if attempt < ITEM_RETRIES:
+                time.sleep(delay)
+                delay *= 2
+        return title, error
+    finally:
+        close()
+
+# Function to download playlist entries through a bounded pool of workers; returns the entries that failed
+def download_playlist(entries, ydl_opts, workers=PLAYLIST_WORKERS, cache=None, archive=None, limiter=None):
+    entries = [entry for entry in entries if entry]
+    workers = max(1, min(workers, len(entries)))
+    progress = PlaylistProgress(len(entries), workers)
+    failed = []
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(download_entry, entry, ydl_opts, progress, cache, archive, limiter) for entry in entries]
+            for future in as_completed(futures):
+                title, error = future.result()
+                progress.item_finished(error is None)
+                if error is not None:
+                    failed.append((title, error))
+    finally:
+        progress.close()
+    return failed
+
 # Function to delete all .webm files in the directory
 def delete_webm_files(directory):
     for webm_file in glob.glob(os.path.join(directory, '*.webm')):
@@ -58,21 +184,39 @@ def download_best_format(url, base_path=None, file_type='video'):
     save_path = os.path.join(base_path, today)
     os.makedirs(save_path, exist_ok=True)
 
+    # Resolved info dicts are reused across runs, so a repeat lookup or format listing needs no extraction
+    cache = InfoCache(os.path.join(base_path, INFO_CACHE_FILE))
+    # Videos finished on any earlier day, checked before anything is extracted or downloaded
+    archive = DownloadArchive(base_path)
+    link_folder = save_path if LINK_ARCHIVED else None
+    # Downloads interrupted on an earlier day are continued in today's folder
+    adopt_partials(base_path, save_path)
+    limiter = BandwidthLimiter(BANDWIDTH_LIMIT)
+    limiter.watch(save_path)
+
     # yt-dlp options to ensure proper downloading
     ydl_opts = {
         'outtmpl': f'{save_path}/%(title)s.%(ext)s',
-        'progress_hooks': [progress_hook],  # Hook for progress updates
+        'progress_hooks': [progress_hook, limiter.hook],  # Hooks for progress updates and the bandwidth cap
         'postprocessors': [{
             'key': 'FFmpegMerger',  # Ensures video and audio streams are merged
         }],
         'noplaylist': False,  # Do not auto-download playlists
         'keepvideo': True,  # Keep the video file after downloading
-        'merge_output_format': 'mp4'  # Ensure merging is done in MP4 format
+        'merge_output_format': 'mp4',  # Ensure merging is done in MP4 format
+        **transfer_options(FRAGMENT_WORKERS),  # Parallel fragments, resumable partial files
     }
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info_dict = ydl.extract_info(url, download=False)
+        archived = archive.find(cache_key(url), file_type, link_folder)
+        if archived is not None:
+            print(f"{Fore.GREEN}Already downloaded: {archived}")
+            return
+
+        # Playlist entries are only listed here; each one is resolved by the worker that downloads it
+        with yt_dlp.YoutubeDL(dict(ydl_opts, extract_flat='in_playlist')) as ydl:
+            archive.attach(ydl)
+            info_dict = extract_info(ydl, url, cache)
 
             # Handle playlists
             if 'entries' in info_dict:  # Playlist detected
@@ -80,8 +224,17 @@ def download_best_format(url, base_path=None, file_type='video'):
                 download_choice = input(f"{Fore.MAGENTA}Do you want to download the entire playlist? (yes/no): ").strip().lower()
 
                 if download_choice == 'yes':
-                    ydl.download([url])
-                    print(f"{Fore.GREEN}Downloaded playlist successfully to {save_path}")
+                    entries = [entry for entry in info_dict['entries'] if entry]
+                    pending = [entry for entry in entries
+                               if archive.find(entry_key(entry), 'video', link_folder) is None]
+                    if len(pending) < len(entries):
+                        action = "linked into today's folder" if LINK_ARCHIVED else "skipped"
+                        print(f"{Fore.CYAN}{len(entries) - len(pending)} videos were already downloaded and are {action}.")
+                    failed = download_playlist(pending, ydl_opts, cache=cache, archive=archive, limiter=limiter) if pending else []
+                    for title, error in failed:
+                        print(f"{Fore.RED}Failed after {ITEM_RETRIES} attempts: {title}: {error}")
+                    print(f"{Fore.GREEN}Downloaded {len(pending) - len(failed)} of "
+                          f"{len(pending)} new playlist videos to {save_path}")
                     delete_webm_files(save_path)  # Delete .webm files after downloading
                     return
                 else:
@@ -90,9 +243,13 @@ def download_best_format(url, base_path=None, file_type='video'):
                         print(f"{Fore.YELLOW}{idx}. {entry['title']}")
 
                     video_index = int(input(f"{Fore.MAGENTA}Enter the number of the video you want to download: ")) - 1
-                    video_url = info_dict['entries'][video_index]['url']
-                    print(f"{Fore.GREEN}Downloading video: {info_dict['entries'][video_index]['title']}")
-                    ydl.download([video_url])
+                    entry = info_dict['entries'][video_index]
+                    archived = archive.find(entry_key(entry), 'video', link_folder)
+                    if archived is not None:
+                        print(f"{Fore.GREEN}Already downloaded: {archived}")
+                        return
+                    print(f"{Fore.GREEN}Downloading video: {entry['title']}")
+                    download_info(ydl, extract_info(ydl, entry['url'], cache, entry_key(entry)), cache)
                     delete_webm_files(save_path)  # Delete .webm files after downloading
                     return
 
@@ -131,21 +288,24 @@ def download_best_format(url, base_path=None, file_type='video'):
             chosen_format = formats[choice]['format_id']
 
             # Check if video-only format and download audio separately
-            if formats[choice]['acodec'] == 'none':
+            if formats[choice].get('acodec') == 'none':
                 print(f"{Fore.YELLOW}Chosen format is video-only. Downloading best available audio stream as well.")
                 ydl_opts['format'] = f"{chosen_format}+bestaudio"
             else:
                 ydl_opts['format'] = chosen_format
 
-        # Download with yt-dlp
+        # Download with yt-dlp, reusing the info dict resolved above instead of extracting the URL again
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([url])
+            archive.attach(ydl, file_type)
+            download_info(ydl, info_dict, cache)
 
         print(f"{Fore.GREEN}Downloaded successfully to {save_path}")
 
     except Exception as e:
         print(f"{Fore.RED}Error: {e}")
     finally:
+        cache.close()
+        archive.close()
         # Delete .webm files after processing
         delete_webm_files(save_path)
 
@@ -0,0 +1,120 @@
+import os
+import time
+import shutil
+import sqlite3
+import hashlib
+import threading
+from yt_dlp.postprocessor.common import PostProcessor  # type: ignore
+from yt_info_cache import cache_key
+
+# Download archive settings
+ARCHIVE_FILE = 'download-archive.sqlite'
+HASH_CHUNK = 1024 * 1024
+
+# Function to hash a file's content without reading it into memory at once
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Persistent index of finished downloads across every date folder, keyed by extractor:video-id (the same
+# keys as the info cache) and by content hash, so nothing is downloaded or stored twice
+class DownloadArchive:
+    def __init__(self, base_path):
+        self.base_path = base_path
+        self.linked = 0
+        # Playlist workers share one archive
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(base_path, ARCHIVE_FILE), check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS downloads ("
+            "key TEXT, kind TEXT, path TEXT, size INTEGER, sha256 TEXT, downloaded REAL, PRIMARY KEY (key, kind))"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS downloads_sha256 ON downloads (sha256)")
+        self.db.commit()
+
+    # Path of an earlier download of this video, or None; entries whose file was deleted are dropped
+    def lookup(self, key, kind='video'):
+        if key is None:
+            return None
+        with self.lock:
+            row = self.db.execute("SELECT path FROM downloads WHERE key = ? AND kind = ?", (key, kind)).fetchone()
+            if row is None:
+                return None
+            path = os.path.join(self.base_path, row[0])
+            if not os.path.exists(path):
+                self.db.execute("DELETE FROM downloads WHERE key = ? AND kind = ?", (key, kind))
+                self.db.commit()
+                return None
+        return path
+
+    # Earlier download of this video, hard-linked into folder (today's) when one is given; None if there is none
+    def find(self, key, kind='video', folder=None):
+        path = self.lookup(key, kind)
+        if path is not None and folder is not None:
+            path = self.link_into(path, folder)
+        return path
+
+    # Record a finished download under its keys; a file whose content is already stored is replaced by a
+    # hard link to it
+    def record(self, keys, path, kind='video'):
+        sha256 = file_sha256(path)
+        with self.lock:
+            for (existing,) in self.db.execute("SELECT path FROM downloads WHERE sha256 = ?", (sha256,)).fetchall():
+                existing = os.path.join(self.base_path, existing)
+                if os.path.exists(existing) and not os.path.samefile(existing, path):
+                    if self.hard_link(existing, path, replace=True):
+                        self.linked += 1
+                    break
+            self.db.executemany(
+                "INSERT OR REPLACE INTO downloads (key, kind, path, size, sha256, downloaded) VALUES (?, ?, ?, ?, ?, ?)",
+                [(key, kind, os.path.relpath(path, self.base_path), os.path.getsize(path), sha256, time.time())
+                 for key in set(keys)],
+            )
+            self.db.commit()
+
+    # Put an archived file into another folder (today's) as a hard link, or a copy across file systems
+    def link_into(self, path, folder):
+        os.makedirs(folder, exist_ok=True)
+        target = os.path.join(folder, os.path.basename(path))
+        if os.path.exists(target):
+            return target
+        if not self.hard_link(path, target):
+            shutil.copy2(path, target)
+        return target
+
+    def hard_link(self, source, target, replace=False):
+        temp_target = target + '.link' if replace else target
+        try:
+            os.link(source, temp_target)
+        except OSError:
+            return False
+        if replace:
+            os.replace(temp_target, target)
+        return True
+
+    # Have every download this YoutubeDL finishes recorded in the archive
+    def attach(self, ydl, kind='video'):
+        ydl.add_post_processor(ArchivePostProcessor(self, kind), when='after_move')
+
+    def close(self):
+        self.db.close()
+
+# yt-dlp post-processor that runs once the final file is in place and records it in the archive
+class ArchivePostProcessor(PostProcessor):
+    def __init__(self, archive, kind='video', downloader=None):
+        super().__init__(downloader)
+        self.archive = archive
+        self.kind = kind
+
+    def run(self, info):
+        path = info.get('filepath')
+        if path and os.path.exists(path) and info.get('extractor_key') and info.get('id'):
+            # Also under the key of the URL it was asked for, which is what the next lookup will use
+            keys = [f"{info['extractor_key']}:{info['id']}"]
+            if info.get('original_url') or info.get('webpage_url'):
+                keys.append(cache_key(info.get('original_url') or info['webpage_url']))
+            self.archive.record(keys, path, self.kind)
+        return [], info
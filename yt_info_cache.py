@@ -0,0 +1,133 @@
+import re
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qs
+import yt_dlp  # type: ignore
+from yt_dlp.utils import DownloadError, ReExtractInfo  # type: ignore
+
+# Metadata cache settings
+INFO_CACHE_FILE = 'yt-info-cache.sqlite'
+INFO_TTL = 6 * 60 * 60  # Seconds a video's info dict is reused
+PLAYLIST_TTL = 15 * 60  # Playlists gain entries, so their listing is refreshed sooner
+EXPIRY_MARGIN = 10 * 60  # Stream URLs carry their own expiry; stop reusing them this long before it
+EXPIRED_STATUSES = (403, 410)  # HTTP errors a stream URL answers with once it has expired
+
+# Function to build the cache key for a URL without fetching it: extractor and video ID where the
+# extractor can tell them from the URL, so youtu.be and watch?v= links share one entry
+@lru_cache(maxsize=4096)
+def cache_key(url):
+    for ie in yt_dlp.extractor.gen_extractor_classes():
+        if ie.suitable(url):
+            video_id = ie.get_temp_id(url) if ie.ie_key() != 'Generic' else None
+            if video_id:
+                return f"{ie.ie_key()}:{video_id}"
+            break
+    return f"url:{url}"
+
+# Function to get the cache key of a playlist entry, which usually names its extractor and ID already
+def entry_key(entry):
+    extractor = entry.get('ie_key') or entry.get('extractor_key')
+    if extractor and entry.get('id'):
+        return f"{extractor}:{entry['id']}"
+    if entry.get('url'):
+        return cache_key(entry['url'])
+    return None
+
+# Function to find when an info dict stops being usable: its TTL, or the earliest expiry of its stream URLs
+def expires_at(info, ttl):
+    expires = time.time() + ttl
+    for f in info.get('formats') or []:
+        expire = parse_qs(urlsplit(f.get('url') or '').query).get('expire')
+        if expire and expire[0].isdigit():
+            expires = min(expires, int(expire[0]) - EXPIRY_MARGIN)
+    return expires
+
+# Persistent cache of resolved info dicts, so repeat lookups and format listings skip extraction
+class InfoCache:
+    def __init__(self, path, ttl=INFO_TTL, playlist_ttl=PLAYLIST_TTL):
+        self.ttl = ttl
+        self.playlist_ttl = playlist_ttl
+        self.hits = 0
+        self.misses = 0
+        # Playlist workers share one cache
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, expires REAL, data BLOB)")
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT expires, data FROM info WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[1]))
+
+    # Store an info dict under the given keys; it must already be sanitized for JSON
+    def put(self, keys, info):
+        ttl = self.playlist_ttl if info.get('_type') == 'playlist' else self.ttl
+        expires = expires_at(info, ttl)
+        if expires <= time.time():
+            return
+        data = zlib.compress(json.dumps(info).encode('utf-8'))
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO info (key, expires, data) VALUES (?, ?, ?)",
+                                [(key, expires, data) for key in set(keys)])
+            self.db.execute("DELETE FROM info WHERE expires < ?", (time.time(),))
+            self.db.commit()
+
+    def forget(self, key):
+        with self.lock:
+            self.db.execute("DELETE FROM info WHERE key = ?", (key,))
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+# Function to get a URL's info dict from the cache, or from yt-dlp (then cached); pass the key when it
+# is already known, e.g. from a flat playlist entry
+def extract_info(ydl, url, cache=None, key=None):
+    key = key or cache_key(url)
+    info = cache.get(key) if cache is not None else None
+    if info is None:
+        info = ydl.sanitize_info(ydl.extract_info(url, download=False))
+        if cache is not None:
+            keys = [key]
+            if info.get('extractor_key') and info.get('id'):
+                keys.append(f"{info['extractor_key']}:{info['id']}")
+            cache.put(keys, info)
+    return info
+
+# Function to tell whether a failed download was refused because its stream URLs have expired; fragment
+# downloads only report the HTTP status in the error message
+def urls_expired(error):
+    if isinstance(error, ReExtractInfo):
+        return True
+    cause = error.exc_info[1] if error.exc_info else None
+    while cause is not None:
+        if getattr(cause, 'status', None) in EXPIRED_STATUSES:
+            return True
+        cause = cause.__cause__
+    return re.search(r'HTTP Error (%s)\b' % '|'.join(map(str, EXPIRED_STATUSES)), error.msg or '') is not None
+
+# Function to download from an info dict that is already resolved, the way yt-dlp's --load-info-json does,
+# instead of extracting the URL a second time; if its stream URLs have expired it is resolved once more
+def download_info(ydl, info, cache=None):
+    try:
+        ydl.process_ie_result(ydl.sanitize_info(info, remove_private_keys=True), download=True)
+    except (DownloadError, ReExtractInfo) as e:
+        # Anything else, e.g. a full disk or a failed merge, would fail again the same way
+        webpage_url = info.get('webpage_url')
+        if webpage_url is None or not urls_expired(e):
+            raise
+        if cache is not None:
+            cache.forget(cache_key(webpage_url))
+            if info.get('extractor_key') and info.get('id'):
+                cache.forget(f"{info['extractor_key']}:{info['id']}")
+        return ydl.download([webpage_url]) == 0
+    return True
@@ -0,0 +1,110 @@
+import os
+import glob
+import time
+import shutil
+import threading
+
+# Transfer settings
+FRAGMENT_WORKERS = 8  # DASH/HLS fragments fetched at once for each video
+HTTP_CHUNK_SIZE = 10 * 1024 * 1024  # Plain HTTP streams are fetched in ranged chunks of this size
+FRAGMENT_RETRIES = 10
+BANDWIDTH_BURST = 1.0  # Seconds of the bandwidth cap that may be used in one burst
+PARTIAL_IDLE = 60  # Seconds a partial file must be untouched before it is moved to another folder
+PARTIAL_PATTERNS = ('*.part', '*.part-Frag*', '*.ytdl')
+
+# Function to build the yt-dlp options for large transfers: fragments in parallel, and partial files
+# (.part plus the .ytdl fragment index) kept and continued, so an interrupted download resumes after a restart
+def transfer_options(fragment_workers=FRAGMENT_WORKERS):
+    return {
+        'concurrent_fragment_downloads': fragment_workers,
+        'http_chunk_size': HTTP_CHUNK_SIZE,
+        'continuedl': True,
+        'nopart': False,
+        'fragment_retries': FRAGMENT_RETRIES,
+        # A missing fragment fails the download, which can then be resumed, instead of leaving a gap in the video
+        'skip_unavailable_fragments': False,
+    }
+
+# Function to move partial downloads left in earlier date folders into today's, where yt-dlp looks for
+# them; returns how many files were moved
+def adopt_partials(base_path, save_path):
+    moved = 0
+    now = time.time()
+    for pattern in PARTIAL_PATTERNS:
+        for path in glob.glob(os.path.join(base_path, '*', pattern)):
+            if os.path.dirname(path) == save_path or not os.path.isfile(path):
+                continue
+            target = os.path.join(save_path, os.path.basename(path))
+            # Files still being written, e.g. by a download that started before midnight, stay where they are
+            if os.path.exists(target) or now - os.path.getmtime(path) < PARTIAL_IDLE:
+                continue
+            try:
+                shutil.move(path, target)
+            except OSError:
+                continue
+            moved += 1
+    return moved
+
+# Token bucket shared by every active download, so together they stay under one bandwidth cap. It is
+# applied through yt-dlp progress hooks: a hook that reports more bytes than the bucket holds sleeps,
+# which holds up the thread (a whole download, or one of its fragments) that is downloading them
+class BandwidthLimiter:
+    def __init__(self, rate=None, burst=BANDWIDTH_BURST):
+        self.rate = rate  # Bytes per second; None for no cap
+        self.capacity = rate * burst if rate else 0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        # Bytes already counted for each file being downloaded
+        self.counted = {}
+        # Size of each partial file found before its download started, i.e. bytes fetched by an earlier run
+        self.resumed = {}
+
+    # Record the partial files in a folder before downloading into it, so only the bytes fetched after a
+    # resume are counted against the cap
+    def watch(self, folder):
+        if not self.rate:
+            return
+        with self.lock:
+            for path in glob.glob(os.path.join(folder, '*.part')):
+                filename = path[:-len('.part')]
+                # Fragments are counted as part of the file they belong to
+                if '.part-Frag' not in filename and filename not in self.counted:
+                    try:
+                        self.resumed[filename] = os.path.getsize(path)
+                    except OSError:
+                        continue
+
+    # yt-dlp progress hook
+    def hook(self, d):
+        if not self.rate:
+            return
+        filename = d.get('filename')
+        if d['status'] != 'downloading':
+            with self.lock:
+                self.counted.pop(filename, None)
+                self.resumed.pop(filename, None)
+            return
+        downloaded = d.get('downloaded_bytes') or 0
+        with self.lock:
+            previous = self.counted.get(filename)
+            if previous is None:
+                # The first report of a resumed file includes the bytes already in its partial file, unless
+                # the download started over
+                previous = self.resumed.pop(filename, 0)
+                if downloaded < previous:
+                    previous = 0
+            elif downloaded <= previous:
+                return
+            self.counted[filename] = downloaded
+            delay = self.take(downloaded - previous)
+        if delay > 0:
+            time.sleep(delay)
+
+    # Take bytes from the bucket, going into debt if needed; returns how long the caller should wait
+    def take(self, count):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= count
+        return -self.tokens / self.rate if self.tokens < 0 else 0